@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the memory used per request and response object
+
+Measures with :mod:`tracemalloc` the memory allocated per object, its own frame included and
+a field read, for the slotted classes and for the previous implementation storing the frame of
+responses and the attributes of requests in a `__dict__`
+
+Reference figures with CPython 3.11 on x86_64:
+
+==================== ================ ========================
+Class                With __slots__   Previous implementation
+==================== ================ ========================
+ZBIoSampleResponse   97 bytes         137 bytes
+ZBRxResponse         95 bytes         135 bytes
+ZBTxRequest          112 bytes        160 bytes
+==================== ================ ========================
+
+Usage, from the root of the repository: python -m benchmarks.memory
+
+"""
+from hachi.request import ZBTxRequest
+from hachi.response import ZBIoSampleResponse, ZBRxResponse
+import tracemalloc
+
+
+NUMBER = 100000
+
+
+class PreviousResponse(object):
+    """Previous implementation of the responses, storing the frame in a `__dict__`"""
+    def __init__(self, frame):
+        self.frame = frame
+
+    @property
+    def analog_mask(self):
+        return self.frame[18]
+
+    @property
+    def options(self):
+        return self.frame[14]
+
+
+class PreviousRequest(object):
+    """Previous implementation of :class:`~hachi.request.ZBTxRequest`, storing its attributes in a `__dict__`"""
+    def __init__(self, data, frame_id):
+        self.frame_id = frame_id
+        self.destination_address_64 = 0
+        self.destination_address_16 = 0xfffe
+        self.broadcast_radius = 0
+        self.options = 0
+        self.data = data
+
+
+def measure(factory):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(i) for i in range(NUMBER)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - objects.__sizeof__()) / NUMBER
+
+
+def io_sample_response(cls):
+    frame = bytes(bytearray.fromhex('7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 02 00 14 02 25 F5'))
+
+    def factory(i):
+        response = cls(frame[:-1] + frame[-1:])  # a frame per response, as received
+        response.analog_mask
+        return response
+    return factory
+
+
+def rx_response(cls):
+    frame = bytes(bytearray.fromhex('7E 00 12 90 00 13 A2 00 40 52 2B AA 7D 84 01 52 78 44 61 74 61 0D'))
+
+    def factory(i):
+        response = cls(frame[:-1] + frame[-1:])  # a frame per response, as received
+        response.options
+        return response
+    return factory
+
+
+def tx_request(cls):
+    data = b'TxData'
+    return lambda i: cls(data, i)
+
+
+def main():
+    for cls, previous, factory in ((ZBIoSampleResponse, PreviousResponse, io_sample_response),
+                                   (ZBRxResponse, PreviousResponse, rx_response), (ZBTxRequest, PreviousRequest, tx_request)):
+        print('%-20s %6.1f bytes/object (previously %.1f)' % (cls.__name__, measure(factory(cls)), measure(factory(previous))))
+
+
+if __name__ == '__main__':
+    main()
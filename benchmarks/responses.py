@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the field access of responses
+
+Compares an :class:`~hachi.response.ZBExplicitRxResponse` decoded through the compiled layout
+against the previous implementation slicing and unpacking the frame on each access, both for
+the construction followed by a single access, the common case, and for an access to each field
+of an existing response
+
+Usage, from the root of the repository: python -m benchmarks.responses
+
+"""
+from hachi.response import ZBExplicitRxResponse
+from struct import unpack
+import timeit
+
+
+FRAME = bytes(bytearray.fromhex('7E 00 18 91 00 13 A2 00 40 52 2B AA 7D 84 E0 E0 22 11 C1 05 02 52 78 44 61 74 61 52'))
+NUMBER = 200000
+
+
+class SlicedResponse(object):
+    """Previous implementation of :class:`~hachi.response.ZBExplicitRxResponse`"""
+    def __init__(self, frame):
+        if frame[3] != ZBExplicitRxResponse.api_id:
+            raise ValueError('Frame with wrong API ID')
+        self.frame = frame
+
+    @property
+    def id_data(self):
+        return self.frame[4:-1]
+
+    @property
+    def source_address_64(self):
+        return unpack('>Q', self.id_data[0:8])[0]
+
+    @property
+    def source_address_16(self):
+        return unpack('>H', self.id_data[8:10])[0]
+
+    @property
+    def source_endpoint(self):
+        return self.id_data[10]
+
+    @property
+    def destination_endpoint(self):
+        return self.id_data[11]
+
+    @property
+    def cluster_id(self):
+        return unpack('>H', self.id_data[12:14])[0]
+
+    @property
+    def profile_id(self):
+        return unpack('>H', self.id_data[14:16])[0]
+
+    @property
+    def options(self):
+        return self.id_data[16]
+
+
+def first(response_class):
+    return response_class(FRAME).cluster_id
+
+
+def fields(response):
+    return (response.source_address_64, response.source_address_16, response.source_endpoint, response.destination_endpoint,
+            response.cluster_id, response.profile_id, response.options)
+
+
+def main():
+    sliced, response = SlicedResponse(FRAME), ZBExplicitRxResponse(FRAME)
+    assert fields(sliced) == fields(response)
+    count = len(response.layout)
+    for name, reference, duration in (
+            ('construction + first access', timeit.timeit(lambda: first(SlicedResponse), number=NUMBER),
+             timeit.timeit(lambda: first(ZBExplicitRxResponse), number=NUMBER)),
+            ('access', timeit.timeit(lambda: fields(sliced), number=NUMBER) / count,
+             timeit.timeit(lambda: fields(response), number=NUMBER) / count)):
+        print('%-30s %8.1f ns (previously %8.1f ns)  x%.1f' % (name, duration / NUMBER * 1e9, reference / NUMBER * 1e9,
+                                                               reference / duration))
+
+
+if __name__ == '__main__':
+    main()
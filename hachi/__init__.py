@@ -7,9 +7,11 @@ __copyright__ = 'Copyright 2013 Antoine Bertin'
 
 from .const import *
 from .core import *
+from .correlation import *
 from .exceptions import *
 from .request import *
 from .response import *
+from .stats import *
 import logging
 
 
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from .const import API_MODE_ESCAPED
+from .core import XBee, escape_frame
+from .correlation import Correlator
+from .exceptions import Closed, Timeout
+import asyncio
+
+
+__all__ = ['XBeeProtocol', 'open_connection']
+
+
+class XBeeProtocol(XBee, asyncio.Protocol):
+    """:class:`~hachi.core.XBee` parser asyncio implementation
+
+    The protocol works over any asyncio byte transport: a socket, a pipe or a serial port
+    with pySerial-asyncio. Requests sent with :meth:`send_and_wait` are correlated with their
+    response by frame id, up to 255 at once, other requests waiting for a free frame id.
+    Other responses are queued and iterated over with ``async for``.
+
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :param timeout: default timeout of :meth:`send_and_wait` in seconds, `None` for no timeout
+    :type timeout: None or int or float
+    :param max_length: maximum length of the frames, see :class:`~hachi.core.XBee`
+    :type max_length: None or int
+
+    """
+    def __init__(self, api_mode=API_MODE_ESCAPED, timeout=None, max_length=None):
+        super(XBeeProtocol, self).__init__(self.response_received, api_mode, max_length=max_length,
+                                          correlator=_FutureCorrelator())
+
+        #: Default timeout of :meth:`send_and_wait` in seconds
+        self.timeout = timeout
+
+        #: Transport
+        self.transport = None
+
+        #: Whether the connection is lost
+        self.closed = False
+
+        self._responses = asyncio.Queue()
+        self._frame_ids = asyncio.Semaphore(255)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.feed(data)
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.correlator.fail(Closed())
+        self._responses.put_nowait(None)
+
+    def response_received(self, response):
+        """Callback called whenever a :class:`~hachi.response.XBeeResponse` is received
+
+        Responses are queued for the iteration, except those correlated with a request sent
+        with :meth:`send_and_wait` and those handled by a subscribed handler
+
+        :param response: the received response
+        :type response: :class:`~hachi.response.XBeeResponse`
+
+        """
+        self._responses.put_nowait(response)
+
+    def send(self, request):
+        """Send a :class:`~hachi.request.XBeeRequest`
+
+        :param request: the request to send
+        :type request: :class:`~hachi.request.XBeeRequest`
+        :raise: :class:`~hachi.exceptions.Closed` when the connection is lost
+
+        """
+        if self.closed:
+            raise Closed
+        if self.api_mode == API_MODE_ESCAPED:
+            self.transport.write(escape_frame(request.frame))
+        else:
+            self.transport.write(request.frame)
+
+    async def send_and_wait(self, request, timeout=None):
+        """Send a :class:`~hachi.request.XBeeRequest` and wait for its response
+
+        The `frame_id` of the request is set to a free frame id
+
+        :param request: the request to send
+        :type request: :class:`~hachi.request.XBeeRequest`
+        :param timeout: timeout in seconds, :attr:`timeout` if `None`
+        :type timeout: None or int or float
+        :raise: :class:`~hachi.exceptions.Timeout` when timeout is exceeded
+        :raise: :class:`~hachi.exceptions.Closed` when the connection is lost
+        :return: the response
+        :rtype: :class:`~hachi.response.XBeeResponse`
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        async with self._frame_ids:
+            if self.closed:
+                raise Closed
+            future = self.correlator.register(request)
+            try:
+                self.send(request)
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                raise Timeout
+            finally:
+                self.correlator.release(request.frame_id, future)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        response = await self._responses.get()
+        if response is None:  # connection lost
+            self._responses.put_nowait(None)
+            raise StopAsyncIteration
+        return response
+
+
+async def open_connection(host, port, api_mode=API_MODE_ESCAPED, timeout=None, max_length=None, **kwargs):
+    """Connect to an XBee over TCP, for instance through a serial to network bridge
+
+    :param str host: host to connect to
+    :param int port: port to connect to
+    :param int api_mode: API mode of the module, see :class:`XBeeProtocol`
+    :param timeout: default timeout of :meth:`XBeeProtocol.send_and_wait`, see :class:`XBeeProtocol`
+    :type timeout: None or int or float
+    :param max_length: maximum length of the frames, see :class:`XBeeProtocol`
+    :type max_length: None or int
+    :param kwargs: other arguments of :meth:`asyncio.loop.create_connection`
+    :return: the connected protocol
+    :rtype: :class:`XBeeProtocol`
+
+    """
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(lambda: XBeeProtocol(api_mode, timeout, max_length), host, port, **kwargs)
+    return protocol
+
+
+class _FutureCorrelator(Correlator):
+    """:class:`~hachi.correlation.Correlator` with asyncio futures"""
+    def create_future(self):
+        return asyncio.get_running_loop().create_future()
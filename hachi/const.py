@@ -14,6 +14,26 @@ XON = 0x11
 XOFF = 0x13
 
 
+# API modes
+#: API mode without escaped characters (AP=1)
+API_MODE_UNESCAPED = 1
+
+#: API mode with escaped characters (AP=2)
+API_MODE_ESCAPED = 2
+
+
+# Overflow policies
+#: Block until there is room in the queue
+OVERFLOW_BLOCK = 0
+
+#: Drop the oldest response of the queue
+OVERFLOW_DROP_OLDEST = 1
+
+#: Drop the oldest response of the queue with a droppable API ID, or the new one if droppable,
+#: block otherwise
+OVERFLOW_DROP_API_IDS = 2
+
+
 # API IDs for requests
 #: API ID for :class:`~hachi.request.Tx64Request`
 TX_64_REQUEST = 0x00
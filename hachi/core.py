@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals
-from .const import FRAME_DELIMITER, ESCAPE, XON, XOFF
-from .response import RESPONSE_MAP
+from .const import FRAME_DELIMITER, ESCAPE, XON, XOFF, API_MODE_ESCAPED
+from .correlation import Correlator
+from .response import RESPONSE_MAP, LENGTH_MAP, FrameView
+from .stats import ParserStats
+from collections import deque
 import logging
+import re
 
-__all__ = ['XBee', 'escape', 'escape_frame', 'unescape']
+__all__ = ['XBee', 'iter_responses', 'encode_frames', 'escape', 'escape_frame', 'escape_frame_into', 'escape_into', 'unescape']
 logger = logging.getLogger(__name__)
 
+#: Matches any of the bytes to escape: FRAME_DELIMITER, ESCAPE, XON and XOFF
+SPECIAL_BYTES = re.compile(b'[\\x7e\\x7d\\x11\\x13]')
+
 
 class XBee(object):
     """Parser for incoming XBee communications
@@ -16,71 +22,427 @@ class XBee(object):
     the corresponding :class:`~hachi.response.XBeeResponse` and the callback is called.
     Any malformed response is silently discarded.
 
+    In :data:`~hachi.const.API_MODE_UNESCAPED`, special bytes are not escaped and frames
+    are extracted from their length only.
+
+    The header of each frame is validated as soon as its API ID is read: its length must not
+    exceed `max_length` and must be plausible for the API ID according to
+    :data:`~hachi.response.LENGTH_MAP`. In :data:`~hachi.const.API_MODE_UNESCAPED`, invalid
+    frames, including those with an invalid checksum, are discarded up to the next
+    :data:`~hachi.const.FRAME_DELIMITER` within the frame so the parser resynchronizes
+    without waiting for more data. In :data:`~hachi.const.API_MODE_ESCAPED`, frames with
+    an invalid escape sequence are discarded up to the next
+    :data:`~hachi.const.FRAME_DELIMITER`.
+
+    Handlers can also be subscribed to the responses of an API ID with :meth:`subscribe`.
+    Responses handled by a subscribed handler are not passed to the callback. When
+    :attr:`subscribed_only` is set, frames with an API ID no handler is subscribed to are
+    skipped before their checksum is verified and without building any response.
+
     :param function callback: callback method called with a
         :class:`~hachi.response.XBeeResponse` as first positional argument
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :param bool lazy: set the `response` attribute to a :class:`~hachi.response.FrameView`
+        instead of a :class:`~hachi.response.XBeeResponse`
+    :param max_length: maximum length of the frames, `None` for the maximum of 65535
+    :type max_length: None or int
+    :param correlator: correlator of the requests sent, if any
+    :type correlator: None or :class:`~hachi.correlation.Correlator`
+
+    Frames are assembled in a :class:`bytearray` reused from frame to frame, so no allocation
+    happens per frame besides the response. It is allocated for frames of up to
+    :attr:`initial_length` and grows when a longer frame is read, up to ``max_length + 4``
+    bytes, so the memory used by a parser stays small and bounded.
+
+    Health counters such as checksum errors or discarded bytes are kept in :attr:`stats`.
+
+    Responses correlated with a request registered in :attr:`correlator` resolve it and are
+    neither dispatched nor passed to the callback, nor skipped when :attr:`subscribed_only` is set.
 
     """
-    def __init__(self, callback=None):
+    #: Length of the frames the buffer is allocated for initially
+    initial_length = 256
+
+    def __init__(self, callback=None, api_mode=API_MODE_ESCAPED, lazy=False, max_length=None, correlator=None):
         self.callback = callback
+
+        #: API mode
+        self.api_mode = api_mode
+
+        #: Whether responses are :class:`~hachi.response.FrameView`
+        self.lazy = lazy
+
+        #: Maximum length of the frames
+        self.max_length = max_length
+
+        self._frame = bytearray(min(self.initial_length, 0xffff if max_length is None else max_length) + 4)
+        self._view = memoryview(self._frame)
+        self._size = 0
+
+        #: Handlers by API ID and by ``(source_address, frame_id)``, see :meth:`subscribe`
+        self.handlers = {}
+
+        #: Whether to skip the frames with an API ID no handler is subscribed to
+        self.subscribed_only = False
+
+        #: Health counters, see :class:`~hachi.stats.ParserStats`
+        self.stats = ParserStats()
+
+        #: :class:`~hachi.correlation.Correlator` of the requests sent, if any
+        self.correlator = correlator
+
         self.reset()
 
     def reset(self):
         """Reset the state of the parser"""
         #: Response
         self.response = None
-        self.buffer = bytearray()
+        self._size = 0
         self._escape_byte = False
 
+    @property
+    def buffer(self):
+        """Unescaped bytes of the current frame
+
+        :type: memoryview
+
+        """
+        return self._view[:self._size]
+
+    def subscribe(self, handler, api_id, source_address=None, frame_id=None):
+        """Subscribe a handler to the responses of an API ID
+
+        The source address is the `source_address_64` of the response or its `source_address`
+        if it has no 64-bit source address
+
+        :param function handler: handler called with a :class:`~hachi.response.XBeeResponse`
+            as first positional argument
+        :param int api_id: the API ID, see :ref:`response_api_ids`
+        :param source_address: only the responses with this source address, all if `None`
+        :type source_address: None or int
+        :param frame_id: only the responses with this frame id, all if `None`
+        :type frame_id: None or int
+
+        """
+        self.handlers.setdefault(api_id, {}).setdefault((source_address, frame_id), []).append(handler)
+
+    def unsubscribe(self, handler, api_id, source_address=None, frame_id=None):
+        """Unsubscribe a handler subscribed with :meth:`subscribe`
+
+        :param function handler: the handler
+        :param int api_id: the API ID
+        :param source_address: the source address
+        :type source_address: None or int
+        :param frame_id: the frame id
+        :type frame_id: None or int
+        :raise: ValueError if the handler is not subscribed
+
+        """
+        key = (source_address, frame_id)
+        try:
+            handlers = self.handlers[api_id][key]
+        except KeyError:
+            raise ValueError('Handler not subscribed')
+        handlers.remove(handler)
+        if not handlers:
+            del self.handlers[api_id][key]
+            if not self.handlers[api_id]:
+                del self.handlers[api_id]
+
     def feed(self, data):
         """Feed the parser with data
 
+        Data is processed by chunks: special bytes are located with :meth:`bytearray.find` and
+        the bytes in between are copied in bulk to the :attr:`buffer`
+
         :param data: byte(s) to add
         :type data: int or bytes or bytearray
 
         """
-        if isinstance(data, str):  # python 2
-            for c in data:
-                self.feed(ord(c))
-            return
-        if isinstance(data, (bytearray, bytes)):
-            for b in data:
-                self.feed(b)
-            return
-        if data == FRAME_DELIMITER:
-            if self.buffer and not self.response:
-                logger.warning('New packet start before previous response is complete, discarding previous packet')
+        if isinstance(data, int):
+            data = bytearray([data])
+        frame, frame_view, view, stats = self._frame, self._view, memoryview(data), self.stats
+        position, end = 0, len(data)
+        stats.bytes_received += end
+        frame_start = None  # position of the frame delimiter if the frame started in this data
+        while position < end:
+            # wait for the frame delimiter, either before the first one or after a complete response
+            if not self._size or self.response is not None:
+                start = data.find(FRAME_DELIMITER, position)
+                if start == -1:
+                    start = end
+                if start > position:
+                    stats.discarded_bytes += start - position
+                    logger.debug('Found %d byte(s) while waiting for frame delimiter, discarding byte(s)', start - position)
+                if start == end:
+                    return
+                self._start_frame()
+                position = frame_start = start + 1
+                continue
+
+            # unescape the byte following an escape byte
+            if self._escape_byte:
+                if data[position] == FRAME_DELIMITER:
+                    self._start_frame()
+                    position += 1
+                    continue
+                if data[position] == ESCAPE:
+                    position += 1
+                    continue
+                byte = data[position] ^ 0x20
+                if byte not in (FRAME_DELIMITER, ESCAPE, XON, XOFF):
+                    logger.warning('Invalid escaped byte %02x, discarding packet', data[position])
+                    stats.invalid_escapes += 1
+                    self.reset()
+                    continue
+                frame[self._size] = byte
+                self._size += 1
+                self._escape_byte = False
+                position += 1
+            else:
+                # copy all bytes up to the next special byte or the end of the header or the frame at once
+                if self._size < 4:
+                    stop = min(end, position + (3 if self._size < 3 else 4) - self._size)
+                else:
+                    stop = min(end, position + (frame[1] << 8) + frame[2] + 4 - self._size)
+                escape = delimiter = -1
+                if self.api_mode == API_MODE_ESCAPED:
+                    delimiter = data.find(FRAME_DELIMITER, position, stop)
+                    if delimiter != -1:
+                        stop = delimiter
+                    escape = data.find(ESCAPE, position, stop)
+                    if escape != -1:
+                        stop = escape
+                frame_view[self._size:self._size + stop - position] = view[position:stop]
+                self._size += stop - position
+                position = stop
+                if escape != -1:  # prepare to unescape next byte
+                    stats.escaped_bytes += 1
+                    self._escape_byte = True
+                    position += 1
+                    continue
+                if delimiter != -1:
+                    self._start_frame()
+                    position += 1
+                    continue
+
+            # check if frame is complete and valid and try to extract a response from it
+            if self._size == 3 and frame[1] == frame[2] == 0:
+                logger.warning('Invalid length, discarding packet')
+                stats.invalid_lengths += 1
+                self.reset()
+            elif (self._size == 4 and not self._verify_header() or
+                  self._size > 4 and self._size - 4 == (frame[1] << 8) + frame[2] and not self._process_frame()):
+                # resynchronize on the next frame delimiter within the discarded frame
+                if self.api_mode != API_MODE_ESCAPED:
+                    if frame_start is None:
+                        data = frame[1:self._size] + data[position:]
+                        view = memoryview(data)
+                        position, end = 0, len(data)
+                    else:
+                        position = frame_start
+                self.reset()
+            elif self._size == 4:  # the buffer may have grown for the frame
+                frame, frame_view = self._frame, self._view
+
+    def _verify_header(self):
+        """Verify the length of the frame in the :attr:`buffer` once its API ID is read
+
+        The buffer grows if the frame is longer than it can hold
+
+        :return: whether the length is valid
+        :rtype: bool
+
+        """
+        length = (self._frame[1] << 8) + self._frame[2]
+        if self.max_length is not None and length > self.max_length:
+            logger.warning('Invalid length %d above maximum, discarding packet', length)
+            self.stats.invalid_lengths += 1
+            return False
+        if self._frame[3] not in LENGTH_MAP:
+            logger.error('Unknown api id %02x, discarding packet', self._frame[3])
+            self.stats.unknown_api_ids += 1
+            return False
+        min_length, max_length = LENGTH_MAP[self._frame[3]]
+        if length < min_length or max_length is not None and length > max_length:
+            logger.warning('Invalid length %d for api id %02x, discarding packet', length, self._frame[3])
+            self.stats.invalid_lengths += 1
+            return False
+        if length + 4 > len(self._frame):
+            self._grow(length + 4)
+        return True
+
+    def _grow(self, size):
+        """Grow the buffer to hold at least `size` bytes, keeping the current frame
+
+        The buffer is replaced rather than resized so views returned by :attr:`buffer` stay valid
+
+        """
+        size = max(size, min(2 * len(self._frame), (0xffff if self.max_length is None else self.max_length) + 4))
+        frame = bytearray(size)
+        frame[:self._size] = self._frame[:self._size]
+        self._frame = frame
+        self._view = memoryview(frame)
+
+    def _start_frame(self):
+        """Start a new frame on a :data:`~hachi.const.FRAME_DELIMITER`"""
+        if self._size and self.response is None:
+            logger.warning('New packet start before previous response is complete, discarding previous packet')
+            self.stats.truncated_frames += 1
+        self.reset()
+        self._frame[0] = FRAME_DELIMITER
+        self._size = 1
+
+    def _process_frame(self):
+        """Verify the complete frame in the :attr:`buffer` and extract a response from it
+
+        :return: whether the frame is valid
+        :rtype: bool
+
+        """
+        api_id = self._frame[3]
+        # skip frames nobody is interested in
+        if self.subscribed_only and self._skip(api_id):
+            self.stats.skipped_frames += 1
             self.reset()
-            self.buffer.append(data)
-            return
-        if not self.buffer:  # don't start the party without our start byte
-            logger.debug('Found byte 0x%x while waiting for frame delimiter, discarding byte', data)
+            return True
+        frame = self._view[:self._size]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Frame complete: %s', ' '.join('%02X' % byte for byte in frame))
+        # verify the checksum
+        if sum(frame[3:]) & 0xff != 0xff:
+            logger.warning('Invalid checksum, discarding packet')
+            self.stats.checksum_errors += 1
+            return False
+        frames = self.stats.frames
+        frames[api_id] = frames.get(api_id, 0) + 1
+        if self.lazy:
+            self.response = FrameView(frame.tobytes())
+        else:
+            self.response = RESPONSE_MAP[api_id](frame.tobytes())
+        self._deliver(self.response)
+        return True
+
+    def _skip(self, api_id):
+        """Whether to skip the frames of an API ID when :attr:`subscribed_only` is set"""
+        if api_id in self.handlers:
+            return False
+        # never skip the responses correlated with a request
+        return self.correlator is None or api_id not in Correlator.api_ids or self._frame[4] not in self.correlator
+
+    def _deliver(self, response):
+        """Resolve the request correlated with a response or pass it to its subscribed handlers or,
+        if there is none, to the callback"""
+        if self.correlator is not None and self.correlator.resolve(response):
             return
-        if data == ESCAPE:  # prepare to unescape next byte
-            self._escape_byte = True
+        if (response.api_id not in self.handlers or not self._dispatch(response)) and self.callback is not None:
+            self.callback(response)
+
+    def _dispatch(self, response):
+        """Call the handlers subscribed to a response
+
+        :return: whether a handler was called
+        :rtype: bool
+
+        """
+        handlers = self.handlers[response.api_id]
+        dispatched = False
+        for key in _dispatch_keys(response, handlers):
+            for handler in list(handlers.get(key, ())):
+                handler(response)
+                dispatched = True
+        return dispatched
+
+
+def _dispatch_keys(response, handlers):
+    """Keys of the handlers matching a response, see :meth:`XBee.subscribe`"""
+    keys = [(None, None)]
+    if len(handlers) == 1 and (None, None) in handlers:
+        return keys
+    source_address = getattr(response, 'source_address_64', None)
+    if source_address is None:
+        source_address = getattr(response, 'source_address', None)
+    frame_id = getattr(response, 'frame_id', None)
+    if source_address is not None:
+        keys.append((source_address, None))
+    if frame_id is not None:
+        keys.append((None, frame_id))
+        if source_address is not None:
+            keys.append((source_address, frame_id))
+    return keys
+
+
+def iter_responses(source, chunk_size=4096, api_mode=API_MODE_ESCAPED, lazy=False, max_length=None):
+    """Iterate over the responses read from a byte source
+
+    Data is read from the `source` by chunks of `chunk_size` bytes and responses are yielded
+    as soon as they are complete so memory usage does not depend on the length of the stream.
+    Iteration stops when the `source` is exhausted: on end of file for file-like objects
+    and when the connection is closed for sockets.
+
+    :param source: file-like object with a `read` method, socket with a `recv` method or
+        iterable of bytes/bytearray chunks
+    :param int chunk_size: maximum number of bytes to read at once
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :param bool lazy: yield :class:`~hachi.response.FrameView` instead of responses
+    :param max_length: maximum length of the frames, see :class:`XBee`
+    :type max_length: None or int
+    :return: the responses
+    :rtype: iterator of :class:`~hachi.response.XBeeResponse` or :class:`~hachi.response.FrameView`
+
+    """
+    responses = deque()
+    parser = XBee(responses.append, api_mode, lazy, max_length)
+    for chunk in _iter_chunks(source, chunk_size):
+        parser.feed(chunk)
+        while responses:
+            yield responses.popleft()
+
+
+def _iter_chunks(source, chunk_size):
+    """Iterate over the chunks of a byte source, see :func:`iter_responses`"""
+    if hasattr(source, 'recv'):
+        read = source.recv
+    elif hasattr(source, 'read'):
+        read = source.read
+    else:
+        for chunk in source:
+            yield chunk
+        return
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
             return
-        if self._escape_byte:  # unescape data
-            data = unescape(data)
-            self._escape_byte = False
-
-        # append data to the buffer
-        self.buffer.append(data)
-
-        # check if frame is complete and valid and try to extract a response from it
-        if len(self.buffer) > 4 and len(self.buffer) - 4 == (self.buffer[1] << 8) + self.buffer[2]:
-            logger.debug('Frame complete: %s', ' '.join('%02X' % byte for byte in self.buffer))
-            # verify the checksum
-            if sum(self.buffer[3:]) & 0xff != 0xff:
-                logger.warning('Invalid checksum, discarding packet')
-                self.reset()
-                return
-            # get the response
-            if self.buffer[3] not in RESPONSE_MAP:
-                logger.error('Unknown api id %02x, discarding packet', self.buffer[3])
-                self.reset()
-                return
-            self.response = RESPONSE_MAP[self.buffer[3]](self.buffer)
-            if self.callback is not None:
-                self.callback(self.response)
+        yield chunk
+
+
+def encode_frames(requests, api_mode=API_MODE_ESCAPED):
+    """Encode many requests in a single buffer
+
+    Each request is written into the same scratch buffer with
+    :meth:`~hachi.request.XBeeRequest.write_into` and escaped at the end of the result
+
+    :param requests: the requests to encode
+    :type requests: iterable of :class:`~hachi.request.XBeeRequest`
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :return: the frames, one after the other
+    :rtype: bytearray
+
+    """
+    frames = bytearray()
+    if api_mode != API_MODE_ESCAPED:
+        for request in requests:
+            request.write_into(frames, len(frames))
+        return frames
+    frame = bytearray()
+    for request in requests:
+        del frame[:]
+        request.write_into(frame)
+        escape_frame_into(frame, frames)
+    return frames
 
 
 def escape(byte):
@@ -100,7 +462,11 @@ def escape(byte):
 def escape_frame(frame):
     """Escape a frame
 
-    :param bytearray frame: the frame to escape, starting with :data:`~hachi.const.FRAME_DELIMITER`
+    When the frame has no special byte to escape, it is returned unchanged if it is a
+    :class:`bytearray`, copied otherwise
+
+    :param frame: the frame to escape, starting with :data:`~hachi.const.FRAME_DELIMITER`
+    :type frame: bytearray or bytes or memoryview
     :raise: ValueError if the frame does not start with a :data:`~hachi.const.FRAME_DELIMITER`
     :return: the escaped frame
     :rtype: bytearray
@@ -108,15 +474,56 @@ def escape_frame(frame):
     """
     if frame[0] != FRAME_DELIMITER:
         raise ValueError('Frame must start with the frame delimiter')
-    escaped_frame = bytearray([FRAME_DELIMITER])
-    for byte in frame[1:]:
-        if byte in (FRAME_DELIMITER, ESCAPE, XON, XOFF):
-            escaped_frame.append(ESCAPE)
-            byte = escape(byte)
-        escaped_frame.append(byte)
+    if SPECIAL_BYTES.search(frame, 1) is None:
+        return frame if isinstance(frame, bytearray) else bytearray(frame)
+    escaped_frame = bytearray()
+    escape_frame_into(frame, escaped_frame)
     return escaped_frame
 
 
+def escape_frame_into(frame, buffer):
+    """Escape a frame at the end of a buffer
+
+    :param frame: the frame to escape, starting with :data:`~hachi.const.FRAME_DELIMITER`
+    :type frame: bytearray or bytes or memoryview
+    :param bytearray buffer: the buffer to append the escaped frame to
+    :raise: ValueError if the frame does not start with a :data:`~hachi.const.FRAME_DELIMITER`
+    :return: the number of bytes appended
+    :rtype: int
+
+    """
+    if frame[0] != FRAME_DELIMITER:
+        raise ValueError('Frame must start with the frame delimiter')
+    buffer.append(FRAME_DELIMITER)
+    return 1 + escape_into(frame, buffer, 1)
+
+
+def escape_into(data, buffer, start=0):
+    """Escape data at the end of a buffer
+
+    Special bytes are located with :data:`SPECIAL_BYTES` and the bytes in between
+    are copied in bulk
+
+    :param data: the data to escape
+    :type data: bytearray or bytes or memoryview
+    :param bytearray buffer: the buffer to append the escaped data to
+    :param int start: position of the first byte to escape in the data
+    :return: the number of bytes appended
+    :rtype: int
+
+    """
+    length = len(buffer)
+    position = start
+    for match in SPECIAL_BYTES.finditer(data, start):
+        special = match.start()
+        buffer.extend(data[position:special])
+        buffer.append(ESCAPE)
+        buffer.append(data[special] ^ 0x20)
+        position = special + 1
+    buffer.extend(data[position:])
+    return len(buffer) - length
+
+
 def unescape(byte):
     """Unescape a byte
 
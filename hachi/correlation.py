@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+from .exceptions import Busy, Timeout
+from .response import RESPONSE_MAP
+from collections import deque
+from concurrent.futures import Future
+from heapq import heapify, heappop, heappush
+from itertools import count
+import threading
+import time
+
+
+__all__ = ['Correlator']
+
+
+class Correlator(object):
+    """Correlate requests and responses by frame id
+
+    Frame ids are allocated from 1 to 255 so up to 255 requests can be in flight at once.
+    Each registered request gets a future resolved with the response echoing its frame id,
+    such as a :class:`~hachi.response.AtResponse` or a :class:`~hachi.response.TxStatusResponse`,
+    or failed with :class:`~hachi.exceptions.Timeout` by :meth:`expire` once its deadline
+    is passed. Frame ids are reused in the order they are released so a late response is
+    unlikely to resolve the wrong request.
+
+    Deadlines of the requests resolved or released before their timeout stay in a heap until
+    they are popped by :meth:`expire`, which must be called periodically, for instance by the
+    reader thread of :class:`~hachi.serial.XBeeSerial`. The heap is rebuilt without them as
+    soon as they outnumber the deadlines of the pending requests so it stays bounded.
+
+    Futures are :class:`concurrent.futures.Future` by default, subclasses can use other kinds
+    of futures by overriding :meth:`create_future`, :meth:`set_result` and :meth:`set_exception`.
+
+    :param timeout: default timeout of requests in seconds, `None` for no timeout
+    :type timeout: None or int or float
+    :param clock: function returning the current time in seconds
+
+    """
+    #: API IDs of the responses echoing a frame id
+    api_ids = frozenset(api_id for api_id, cls in RESPONSE_MAP.items() if any(field[0] == 'frame_id' for field in cls.layout))
+
+    def __init__(self, timeout=None, clock=time.monotonic):
+        #: Default timeout of requests in seconds
+        self.timeout = timeout
+
+        #: Function returning the current time in seconds
+        self.clock = clock
+
+        self._free = deque(range(1, 256))
+        self._pending = [None] * 256
+        self._deadlines = []
+        self._dead = 0
+        self._sequence = count()
+        self._lock = threading.Lock()
+
+    def register(self, request, timeout=None):
+        """Allocate a frame id to a request and track it until its response
+
+        :param request: the request, its `frame_id` is set
+        :type request: :class:`~hachi.request.XBeeRequest`
+        :param timeout: timeout in seconds, :attr:`timeout` if `None`
+        :type timeout: None or int or float
+        :raise: :class:`~hachi.exceptions.Busy` when all frame ids are in use
+        :return: the future of the response
+        :rtype: :class:`concurrent.futures.Future`
+
+        """
+        if timeout is None:
+            timeout = self.timeout
+        future = self.create_future()
+        with self._lock:
+            if not self._free:
+                raise Busy
+            frame_id = self._free.popleft()
+            sequence = next(self._sequence)
+            self._pending[frame_id] = (future, sequence, timeout is not None)
+            if timeout is not None:
+                heappush(self._deadlines, (self.clock() + timeout, sequence, frame_id))
+        request.frame_id = frame_id
+        return future
+
+    def resolve(self, response):
+        """Resolve the future of the request matching the frame id of a response
+
+        This can be used as callback of the :class:`~hachi.core.XBee` parser
+
+        :param response: the response
+        :type response: :class:`~hachi.response.XBeeResponse`
+        :return: whether a request matched
+        :rtype: bool
+
+        """
+        frame_id = getattr(response, 'frame_id', 0)
+        if not frame_id:
+            return False
+        with self._lock:
+            entry = self._pending[frame_id]
+            if entry is None:
+                return False
+            self._remove(frame_id, entry)
+        self.set_result(entry[0], response)
+        return True
+
+    def expire(self, now=None):
+        """Fail the futures of the requests whose deadline is passed
+
+        Call this periodically, for instance at :attr:`next_deadline`
+
+        :param now: current time in seconds, from :attr:`clock` if `None`
+        :type now: None or int or float
+        :return: the number of expired requests
+        :rtype: int
+
+        """
+        if now is None:
+            now = self.clock()
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, sequence, frame_id = heappop(self._deadlines)
+                entry = self._pending[frame_id]
+                if entry is None or entry[1] != sequence:  # already resolved
+                    self._dead -= 1
+                    continue
+                self._pending[frame_id] = None
+                self._free.append(frame_id)
+                expired.append(entry[0])
+        for future in expired:
+            self.set_exception(future, Timeout())
+        return len(expired)
+
+    def release(self, frame_id, future):
+        """Stop tracking a request without resolving its future, freeing its frame id
+
+        :param int frame_id: the frame id of the request
+        :param future: the future of the request, nothing is done if it does not match
+        :return: whether the request was tracked
+        :rtype: bool
+
+        """
+        with self._lock:
+            entry = self._pending[frame_id]
+            if entry is None or entry[0] is not future:
+                return False
+            self._remove(frame_id, entry)
+        return True
+
+    def fail(self, exception):
+        """Fail the futures of all the pending requests
+
+        :param exception: the exception
+        :type exception: :class:`~hachi.exceptions.HachiError`
+
+        """
+        with self._lock:
+            futures = [entry[0] for entry in self._pending if entry is not None]
+            for frame_id, entry in enumerate(self._pending):
+                if entry is not None:
+                    self._pending[frame_id] = None
+                    self._free.append(frame_id)
+            del self._deadlines[:]
+            self._dead = 0
+        for future in futures:
+            self.set_exception(future, exception)
+
+    @property
+    def next_deadline(self):
+        """Earliest deadline of the pending requests, `None` if there is none"""
+        with self._lock:
+            while self._deadlines and not self._is_pending(self._deadlines[0]):
+                heappop(self._deadlines)
+                self._dead -= 1
+            if not self._deadlines:
+                return None
+            return self._deadlines[0][0]
+
+    def _remove(self, frame_id, entry):
+        """Stop tracking a pending request before its deadline, with the lock held"""
+        self._pending[frame_id] = None
+        self._free.append(frame_id)
+        if not entry[2]:
+            return
+        self._dead += 1
+        if self._dead * 2 > len(self._deadlines):
+            self._deadlines = [deadline for deadline in self._deadlines if self._is_pending(deadline)]
+            heapify(self._deadlines)
+            self._dead = 0
+
+    def _is_pending(self, deadline):
+        """Whether the request of a deadline is still pending, with the lock held"""
+        entry = self._pending[deadline[2]]
+        return entry is not None and entry[1] == deadline[1]
+
+    def create_future(self):
+        """Create the future of a request
+
+        :rtype: :class:`concurrent.futures.Future`
+
+        """
+        return Future()
+
+    def set_result(self, future, response):
+        """Resolve the future of a request with its response
+
+        :param future: the future
+        :param response: the response
+        :type response: :class:`~hachi.response.XBeeResponse`
+
+        """
+        if not future.done():
+            future.set_result(response)
+
+    def set_exception(self, future, exception):
+        """Fail the future of a request
+
+        :param future: the future
+        :param exception: the exception
+        :type exception: :class:`~hachi.exceptions.HachiError`
+
+        """
+        if not future.done():
+            future.set_exception(exception)
+
+    def __contains__(self, frame_id):
+        return self._pending[frame_id] is not None
+
+    def __len__(self):
+        return 255 - len(self._free)
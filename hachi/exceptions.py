@@ -9,3 +9,13 @@ class HachiError(Exception):
 class Timeout(HachiError):
     """Timeout"""
     pass
+
+
+class Closed(HachiError):
+    """Closed queue"""
+    pass
+
+
+class Busy(HachiError):
+    """No frame id available"""
+    pass
@@ -1,14 +1,16 @@
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals
-from .compat import pack
 from .const import (FRAME_DELIMITER, TRANSMIT_OPTION_APPLY_CHANGES, TX_64_REQUEST,
     TX_16_REQUEST, AT_REQUEST, AT_QUEUE_REQUEST, ZB_TX_REQUEST,
     ZB_EXPLICIT_TX_REQUEST, REMOTE_AT_REQUEST)
 from hachi.const import (ADDRESS_64_COORDINATOR, ADDRESS_16_USE_64_BIT_ADDRESSING,
-    BROADCAST_RADIUS_MAX_HOPS)
+    BROADCAST_RADIUS_MAX_HOPS, API_MODE_ESCAPED)
+from .core import escape_frame, escape_into
+from operator import attrgetter
+from struct import Struct
 
 __all__ = ['XBeeRequest', 'Tx64Request', 'Tx16Request', 'AtRequest', 'AtQueueRequest',
-           'ZBTxRequest', 'ZBExplicitTxRequest', 'RemoteAtRequest', 'REQUEST_MAP']
+           'ZBTxRequest', 'ZBExplicitTxRequest', 'RemoteAtRequest', 'REQUEST_MAP',
+           'RequestTemplate']
 
 
 #: Frame id used by default. It is non-zero to trigger a status response
@@ -24,7 +26,16 @@ class XBeeRequest(object):
     The :class:`XBeeRequest` provides helpers to access to the raw API frame.
     Unless specified, the type of attributes is :class:`int`.
 
+    Requests have no `__dict__`, their attributes being stored in `__slots__`.
+    Subclasses that do not define `__slots__` get a `__dict__` as usual.
+
+    Frames are encoded by :meth:`write_into`: the header and the fields of the :attr:`layout`
+    are packed at once with a precompiled :class:`struct.Struct`, followed by the :attr:`payload`
+    and the checksum.
+
     """
+    __slots__ = ()
+
     api_id = None
     """API ID
 
@@ -32,38 +43,81 @@ class XBeeRequest(object):
 
     """
 
+    layout = ()
+    """Layout of the fixed size fields at the start of the :attr:`id_data`
+
+    Sequence of ``(name, format)`` tuples where `format` is a :mod:`struct` format character.
+    The layout is compiled once per class, with the frame header, in a single big-endian
+    :class:`struct.Struct`
+
+    """
+
+    @property
+    def payload(self):
+        """Variable length data after the fields of the :attr:`layout`
+
+        Subclasses must implement this, unless they have no :attr:`layout` and implement
+        :attr:`id_data` instead
+
+        :type: bytearray or bytes
+
+        """
+        if not self.layout and type(self).id_data is not XBeeRequest.id_data:
+            return self.id_data
+        raise NotImplementedError
+
     @property
     def length(self):
         """Computed length"""
-        return 1 + len(self.id_data)
+        return _compile(type(self)).size - 3 + len(self.payload)
 
     @property
     def id_data(self):
         """API ID-specific raw data, bytes between the :attr:`api_id` and the :attr:`checksum`
 
-        Subclasses must implement this
+        Subclasses without :attr:`layout` may implement this instead of the :attr:`payload`
 
         :type: bytearray
+
         """
-        raise NotImplementedError
+        return self.frame[4:-1]
 
     @property
     def checksum(self):
         """Computed checksum"""
-        return 0xff ^ (self.api_id + sum(self.id_data)) & 0xff
+        return self.frame[-1]
 
     @property
     def frame(self):
         """Computed frame"""
         frame = bytearray()
-        frame.append(FRAME_DELIMITER)
-        frame.append((self.length >> 8) & 0xff)
-        frame.append(self.length & 0xff)
-        frame.append(self.api_id)
-        frame.extend(self.id_data)
-        frame.append(self.checksum)
+        self.write_into(frame)
         return frame
 
+    def write_into(self, buffer, offset=0):
+        """Write the frame into a buffer
+
+        A :class:`bytearray` too short to hold the frame is extended, other writable buffers
+        must be at least ``offset + len(request) + 4`` bytes long
+
+        :param buffer: the buffer to write into
+        :type buffer: bytearray or writable memoryview
+        :param int offset: position of the frame in the buffer
+        :return: the number of bytes written
+        :rtype: int
+
+        """
+        header = _compile(type(self))
+        payload = self.payload
+        start = offset + header.struct.size
+        stop = start + len(payload)
+        if len(buffer) <= stop and isinstance(buffer, bytearray):
+            buffer.extend(bytearray(stop + 1 - len(buffer)))
+        header.struct.pack_into(buffer, offset, FRAME_DELIMITER, stop - offset - 3, self.api_id, *header.values(self))
+        buffer[start:stop] = payload
+        buffer[stop] = 0xff - (sum(memoryview(buffer)[offset + 3:stop]) & 0xff)
+        return stop + 1 - offset
+
     def __len__(self):
         return self.length
 
@@ -74,6 +128,8 @@ class XBeeRequest(object):
 class Tx64Request(XBeeRequest):
     """Tx Request using 64-bit addressing"""
     api_id = TX_64_REQUEST
+    layout = (('frame_id', 'B'), ('destination_address', 'Q'), ('options', 'B'))
+    __slots__ = ('frame_id', 'destination_address', 'options', 'data')
 
     def __init__(self, data, destination_address=ADDRESS_64_COORDINATOR, options=TRANSMIT_OPTION_DEFAULT, frame_id=FRAME_ID_DEFAULT):
         #: Frame id
@@ -93,18 +149,15 @@ class Tx64Request(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(pack('>Q', self.destination_address))
-        id_data.append(self.options)
-        id_data.extend(self.data)
-        return id_data
+    def payload(self):
+        return self.data
 
 
 class Tx16Request(XBeeRequest):
     """Tx Request using 16-bit addressing"""
     api_id = TX_16_REQUEST
+    layout = (('frame_id', 'B'), ('destination_address', 'H'), ('options', 'B'))
+    __slots__ = ('frame_id', 'destination_address', 'options', 'data')
 
     def __init__(self, data, destination_address, options=TRANSMIT_OPTION_DEFAULT, frame_id=FRAME_ID_DEFAULT):
         #: Frame id
@@ -124,18 +177,15 @@ class Tx16Request(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(pack('>H', self.destination_address))
-        id_data.append(self.options)
-        id_data.extend(self.data)
-        return id_data
+    def payload(self):
+        return self.data
 
 
 class AtRequest(XBeeRequest):
     """At Request"""
     api_id = AT_REQUEST
+    layout = (('frame_id', 'B'), ('command', '2s'))
+    __slots__ = ('frame_id', 'command', 'parameter')
 
     def __init__(self, command, parameter=None, frame_id=FRAME_ID_DEFAULT):
         #: Frame id
@@ -158,18 +208,17 @@ class AtRequest(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(self.command)
-        if self.parameter is not None:
-            id_data.extend(self.parameter)
-        return id_data
+    def payload(self):
+        if self.parameter is None:
+            return b''
+        return self.parameter
 
 
 class AtQueueRequest(XBeeRequest):
     """At Queue Request"""
     api_id = AT_QUEUE_REQUEST
+    layout = (('frame_id', 'B'), ('command', '2s'))
+    __slots__ = ('frame_id', 'command', 'parameter')
 
     def __init__(self, command, parameter=None, frame_id=FRAME_ID_DEFAULT):
         #: Frame id
@@ -192,17 +241,19 @@ class AtQueueRequest(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(self.command)
-        if self.parameter is not None:
-            id_data.extend(self.parameter)
-        return id_data
+    def payload(self):
+        if self.parameter is None:
+            return b''
+        return self.parameter
 
 
 class ZBTxRequest(XBeeRequest):
     """ZB Tx Request"""
+    api_id = ZB_TX_REQUEST
+    layout = (('frame_id', 'B'), ('destination_address_64', 'Q'), ('destination_address_16', 'H'),
+              ('broadcast_radius', 'B'), ('options', 'B'))
+    __slots__ = ('frame_id', 'destination_address_64', 'destination_address_16', 'broadcast_radius', 'options', 'data')
+
     def __init__(self, data, destination_address_64=ADDRESS_64_COORDINATOR, destination_address_16=ADDRESS_16_USE_64_BIT_ADDRESSING,
                  broadcast_radius=BROADCAST_RADIUS_MAX_HOPS, options=TRANSMIT_OPTION_DEFAULT, frame_id=FRAME_ID_DEFAULT):
         #: Frame id
@@ -228,24 +279,18 @@ class ZBTxRequest(XBeeRequest):
         """
 
     @property
-    def api_id(self):
-        return ZB_TX_REQUEST
-
-    @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(pack('>Q', self.destination_address_64))
-        id_data.extend(pack('>H', self.destination_address_16))
-        id_data.append(self.broadcast_radius)
-        id_data.append(self.options)
-        id_data.extend(self.data)
-        return id_data
+    def payload(self):
+        return self.data
 
 
 class ZBExplicitTxRequest(XBeeRequest):
     """ZB Explicit Tx Request"""
     api_id = ZB_EXPLICIT_TX_REQUEST
+    layout = (('frame_id', 'B'), ('destination_address_64', 'Q'), ('destination_address_16', 'H'),
+              ('source_endpoint', 'B'), ('destination_endpoint', 'B'), ('cluster_id', 'H'), ('profile_id', 'H'),
+              ('broadcast_radius', 'B'), ('options', 'B'))
+    __slots__ = ('frame_id', 'destination_address_64', 'destination_address_16', 'source_endpoint', 'destination_endpoint',
+                 'cluster_id', 'profile_id', 'broadcast_radius', 'options', 'data')
 
     def __init__(self, data, destination_address_64, source_endpoint, destination_endpoint, cluster_id, profile_id,
                  destination_address_16=ADDRESS_16_USE_64_BIT_ADDRESSING, broadcast_radius=BROADCAST_RADIUS_MAX_HOPS,
@@ -285,24 +330,16 @@ class ZBExplicitTxRequest(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(pack('>Q', self.destination_address_64))
-        id_data.extend(pack('>H', self.destination_address_16))
-        id_data.append(self.source_endpoint)
-        id_data.append(self.destination_endpoint)
-        id_data.extend(pack('>H', self.cluster_id))
-        id_data.extend(pack('>H', self.profile_id))
-        id_data.append(self.broadcast_radius)
-        id_data.append(self.options)
-        id_data.extend(self.data)
-        return id_data
+    def payload(self):
+        return self.data
 
 
 class RemoteAtRequest(XBeeRequest):
     """Remote At Request"""
     api_id = REMOTE_AT_REQUEST
+    layout = (('frame_id', 'B'), ('destination_address_64', 'Q'), ('destination_address_16', 'H'), ('options', 'B'),
+              ('command', '2s'))
+    __slots__ = ('frame_id', 'destination_address_64', 'destination_address_16', 'options', 'command', 'parameter')
 
     def __init__(self, command, destination_address_64, parameter=None, destination_address_16=ADDRESS_16_USE_64_BIT_ADDRESSING,
                  options=TRANSMIT_OPTION_APPLY_CHANGES, frame_id=FRAME_ID_DEFAULT):
@@ -335,15 +372,127 @@ class RemoteAtRequest(XBeeRequest):
         """
 
     @property
-    def id_data(self):
-        id_data = bytearray()
-        id_data.append(self.frame_id)
-        id_data.extend(pack('>Q', self.destination_address_64))
-        id_data.extend(pack('>H', self.destination_address_16))
-        id_data.append(self.options)
-        id_data.extend(self.command)
-        if self.parameter is not None:
-            id_data.extend(self.parameter)
-        return id_data
+    def payload(self):
+        if self.parameter is None:
+            return b''
+        return self.parameter
+
 
 REQUEST_MAP = {c.api_id: c for c in (Tx64Request, Tx16Request, AtRequest, AtQueueRequest, ZBTxRequest, ZBExplicitTxRequest, RemoteAtRequest)}
+
+
+class RequestTemplate(object):
+    """Template to encode a request many times with a different frame id and payload
+
+    The frame of the `request` is encoded once and split around the frame id and the payload.
+    The constant parts are escaped, according to the `api_mode`, and their contribution to the
+    checksum computed once so encoding a frame only costs the copy of its payload.
+
+    :param request: the request, its payload being ignored
+    :type request: :class:`XBeeRequest`
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :raise: ValueError if the request has no frame id
+
+    """
+    __slots__ = ('request', 'api_mode', 'frame_id', '_length', '_sum', '_api_id', '_fields', '_bytes')
+
+    def __init__(self, request, api_mode=API_MODE_ESCAPED):
+        layout = _compile(type(request))
+        if not layout.names or layout.names[0] != 'frame_id':
+            raise ValueError('Request without frame id')
+
+        #: Request
+        self.request = request
+
+        #: API mode
+        self.api_mode = api_mode
+
+        #: Frame id used by default
+        self.frame_id = request.frame_id
+
+        frame = request.frame
+        self._length = layout.size - 3
+        self._sum = sum(frame[3:4]) + sum(frame[5:layout.size])
+        self._bytes = _ESCAPED_BYTES if api_mode == API_MODE_ESCAPED else _BYTES
+        self._api_id = self._bytes[frame[3]]
+        self._fields = bytearray()
+        if api_mode == API_MODE_ESCAPED:
+            escape_into(frame[5:layout.size], self._fields)
+        else:
+            self._fields += frame[5:layout.size]
+        self._fields = bytes(self._fields)
+
+    def encode(self, payload=b'', frame_id=None):
+        """Encode a frame
+
+        :param payload: the payload, like the :attr:`~XBeeRequest.payload` of the request
+        :type payload: bytearray or bytes
+        :param int frame_id: the frame id, :attr:`frame_id` if `None`
+        :return: the frame, escaped according to the :attr:`api_mode`
+        :rtype: bytearray
+
+        """
+        frame = bytearray()
+        self.encode_into(frame, payload, frame_id)
+        return frame
+
+    def encode_into(self, buffer, payload=b'', frame_id=None):
+        """Encode a frame at the end of a buffer
+
+        :param bytearray buffer: the buffer to append the frame to
+        :param payload: the payload, like the :attr:`~XBeeRequest.payload` of the request
+        :type payload: bytearray or bytes
+        :param int frame_id: the frame id, :attr:`frame_id` if `None`
+        :return: the number of bytes appended
+        :rtype: int
+
+        """
+        if frame_id is None:
+            frame_id = self.frame_id
+        length = self._length + len(payload)
+        start = len(buffer)
+        buffer.append(FRAME_DELIMITER)
+        buffer += self._bytes[length >> 8]
+        buffer += self._bytes[length & 0xff]
+        buffer += self._api_id
+        buffer += self._bytes[frame_id]
+        buffer += self._fields
+        if self.api_mode == API_MODE_ESCAPED:
+            escape_into(payload, buffer)
+        else:
+            buffer += payload
+        buffer += self._bytes[0xff - ((self._sum + frame_id + sum(payload)) & 0xff)]
+        return len(buffer) - start
+
+
+#: Each byte
+_BYTES = tuple(bytes(bytearray([byte])) for byte in range(256))
+
+#: Each byte, escaped
+_ESCAPED_BYTES = tuple(bytes(escape_frame(bytearray([FRAME_DELIMITER, byte]))[1:]) for byte in range(256))
+
+
+class _Layout(object):
+    """Compiled :attr:`XBeeRequest.layout`, with the frame header"""
+    def __init__(self, layout):
+        self.struct = Struct('>BHB' + ''.join(field[1] for field in layout))
+        self.names = tuple(field[0] for field in layout)
+        self.size = self.struct.size
+        #: Get the values of the fields of the layout from a request, as a tuple
+        self.values = attrgetter(*self.names) if len(self.names) > 1 else lambda request: tuple(getattr(request, name) for name in self.names)
+
+
+def _compile(cls):
+    """Compile the :attr:`~XBeeRequest.layout` of a request class once
+
+    :param cls: the request class
+    :return: the compiled layout
+    :rtype: :class:`_Layout`
+
+    """
+    try:
+        return cls.__dict__['_layout']
+    except KeyError:
+        cls._layout = _Layout(cls.layout)
+        return cls._layout
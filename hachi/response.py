@@ -1,23 +1,76 @@
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals, division
-from .compat import unpack
 from .const import (RX_64_RESPONSE, RX_16_RESPONSE, RX_64_IO_RESPONSE,
     RX_16_IO_RESPONSE, AT_RESPONSE, TX_STATUS_RESPONSE, MODEM_STATUS_RESPONSE,
     ZB_TX_STATUS_RESPONSE, ZB_RX_RESPONSE, ZB_EXPLICIT_RX_RESPONSE,
     ZB_IO_SAMPLE_RESPONSE, REMOTE_AT_RESPONSE)
+from array import array
+from struct import Struct, calcsize
+import sys
 
 __all__ = ['XBeeResponse', 'Rx64Response', 'Rx16Response', 'Rx64IoSampleResponse', 'Rx16IoSampleResponse',
            'AtResponse', 'TxStatusResponse', 'ModemStatusResponse', 'ZBTxStatusResponse',
            'ZBRxResponse', 'ZBExplicitRxResponse', 'ZBIoSampleResponse', 'RemoteAtResponse',
-           'RESPONSE_MAP', 'bitcount']
+           'RESPONSE_MAP', 'LENGTH_MAP', 'FrameView', 'bitcount', 'decode_zb_io_samples']
+
+
+class _Layout(object):
+    """Compiled :attr:`XBeeResponse.layout`"""
+    def __init__(self, layout):
+        self.struct = Struct('>' + ''.join(field[1] for field in layout))
+        self.names = tuple(field[0] for field in layout)
+        self.masks = tuple(field[2] if len(field) > 2 else None for field in layout)
+        #: Position of each field in the frame
+        self.offsets = tuple(4 + calcsize('>' + ''.join(field[1] for field in layout[:index])) for index in range(len(layout)))
+        #: Minimum size of the frame, with the checksum
+        self.size = 5 + self.struct.size
+
+
+def _compile(cls):
+    """Compile the :attr:`~XBeeResponse.layout` of a response class once
+
+    :param cls: the response class
+    :return: the compiled layout
+    :rtype: :class:`_Layout`
+
+    """
+    try:
+        return cls.__dict__['_layout']
+    except KeyError:
+        cls._layout = _Layout(cls.layout)
+        return cls._layout
+
+
+class _Field(object):
+    """Descriptor of a field of the :attr:`XBeeResponse.layout`, unpacked from the frame on access"""
+    __slots__ = ('unpack_from', 'offset', 'mask')
+
+    def __init__(self, format, offset, mask=None):
+        self.unpack_from = Struct('>' + format).unpack_from
+        self.offset = offset
+        self.mask = mask
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.mask is None:
+            return self.unpack_from(instance.frame, self.offset)[0]
+        return self.unpack_from(instance.frame, self.offset)[0] & self.mask
 
 
 class XBeeResponse(object):
     """Base class for all XBee responses
 
     The :class:`XBeeResponse` is a wrapper around the underlying raw API frame.
+    A mutable `frame` is copied so the response cannot be altered afterwards and
+    variable length fields are read-only :class:`memoryview` on that frame.
+
+    Responses have no `__dict__`, only the `frame` being stored in `__slots__`. Subclasses
+    that do not define `__slots__` get a `__dict__` as usual.
 
-    :param bytearray frame: unescaped raw API frame
+    :param frame: unescaped raw API frame
+    :type frame: bytes or bytearray or memoryview
+    :raise: ValueError if the API ID of the frame is wrong or if the frame is too short for
+        the :attr:`layout`
 
     """
     api_id = None
@@ -26,16 +79,47 @@ class XBeeResponse(object):
     Subclasses must implement this and return the corresponding API ID
 
     """
+
+    layout = ()
+    """Layout of the fixed size fields at the start of the :attr:`id_data`
+
+    Sequence of ``(name, format)`` or ``(name, format, mask)`` tuples where `format` is a
+    :mod:`struct` format character and `mask` a bit mask applied to the decoded value.
+    The layout is compiled once per class in a single big-endian :class:`struct.Struct`
+    and a descriptor per field unpacking it from the `frame` on access, so responses hold
+    nothing but their frame
+
+    """
+    fixed_size = False
+    """Whether the :attr:`id_data` is made of the fields of the :attr:`layout` only"""
+
+    __slots__ = ('frame',)
+
+    def __init_subclass__(cls, **kwargs):
+        super(XBeeResponse, cls).__init_subclass__(**kwargs)
+        if 'layout' not in cls.__dict__:
+            return
+        layout = _compile(cls)
+        for field, offset in zip(cls.layout, layout.offsets):
+            if field[0] not in cls.__dict__:
+                setattr(cls, field[0], _Field(field[1], offset, field[2] if len(field) > 2 else None))
+
     def __init__(self, frame):
         if frame[3] != self.api_id:
             raise ValueError('Frame with wrong API ID')
+        if isinstance(frame, bytearray):
+            frame = bytes(frame)
+        elif isinstance(frame, memoryview) and not frame.readonly:
+            frame = frame.toreadonly()
+        if len(frame) < self._layout.size:
+            raise ValueError('Frame too short for the layout')
         #: Unescaped raw API frame
         self.frame = frame
 
     @property
     def length(self):
         """Length, on 2 bytes starting right after the :data:`~hachi.const.FRAME_DELIMITER` of the :attr:`frame`"""
-        return unpack('>H', self.frame[1:3])[0]
+        return (self.frame[1] << 8) + self.frame[2]
 
     @property
     def id_data(self):
@@ -43,8 +127,10 @@ class XBeeResponse(object):
 
         Subclasses may provide properties to access API ID-specific data
 
+        :type: memoryview
+
         """
-        return self.frame[4:-1]
+        return memoryview(self.frame)[4:-1]
 
     @property
     def checksum(self):
@@ -58,7 +144,7 @@ class XBeeResponse(object):
         :rtype: bool
 
         """
-        return sum(self.frame[3:]) & 0xff == 0xff
+        return sum(memoryview(self.frame)[3:]) & 0xff == 0xff
 
     def __len__(self):
         return self.length
@@ -67,28 +153,30 @@ class XBeeResponse(object):
         return '<%s(len=%d)>' % (self.__class__.__name__, self.length)
 
 
+_compile(XBeeResponse)
+
+
 class Rx64Response(XBeeResponse):
     """Response to a :class:`~hachi.request.Tx64Request`
 
     Frame example: 7E 00 10 80 00 13 A2 00 40 52 2B AA 16 03 F1 2E AA BD C9 FB
 
-    """
-    api_id = RX_64_RESPONSE
+    .. attribute:: source_address
 
-    @property
-    def source_address(self):
-        """Source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>Q', self.id_data[0:8])[0]
+        Source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def rssi(self):
-        """RSSI, immediatly following the :attr:`source_address`"""
-        return self.id_data[8]
+    .. attribute:: rssi
 
-    @property
-    def options(self):
-        """Options, immediatly following the :attr:`rssi`"""
-        return self.id_data[9]
+        RSSI, immediatly following the :attr:`source_address`
+
+    .. attribute:: options
+
+        Options, immediatly following the :attr:`rssi`
+
+    """
+    api_id = RX_64_RESPONSE
+    layout = (('source_address', 'Q'), ('rssi', 'B'), ('options', 'B'))
+    __slots__ = ()
 
     @property
     def data(self):
@@ -101,23 +189,22 @@ class Rx16Response(XBeeResponse):
 
     Frame example: 7E 00 0A 81 52 1A 23 01 12 33 85 A1 F2 91'
 
-    """
-    api_id = RX_16_RESPONSE
+    .. attribute:: source_address
 
-    @property
-    def source_address(self):
-        """Source address, first 2 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>H', self.id_data[0:2])[0]
+        Source address, first 2 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def rssi(self):
-        """RSSI, immediatly following the :attr:`source_address`"""
-        return self.id_data[2]
+    .. attribute:: rssi
 
-    @property
-    def options(self):
-        """Options, immediatly following the :attr:`rssi`"""
-        return self.id_data[3]
+        RSSI, immediatly following the :attr:`source_address`
+
+    .. attribute:: options
+
+        Options, immediatly following the :attr:`rssi`
+
+    """
+    api_id = RX_16_RESPONSE
+    layout = (('source_address', 'H'), ('rssi', 'B'), ('options', 'B'))
+    __slots__ = ()
 
     @property
     def data(self):
@@ -130,28 +217,26 @@ class Rx64IoSampleResponse(XBeeResponse):
 
     Frame example: 7E 00 14 82 00 13 A2 00 40 52 2B AA 23 01 02 14 88 00 80 00 8F 03 ED 00 08 02 4C 00 0C 3E
 
-    """
-    api_id = RX_64_IO_RESPONSE
+    .. attribute:: source_address
 
-    @property
-    def source_address(self):
-        """Source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>Q', self.id_data[0:8])[0]
+        Source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def rssi(self):
-        """RSSI, immediatly following the :attr:`source_address`"""
-        return self.id_data[8]
+    .. attribute:: rssi
 
-    @property
-    def options(self):
-        """Options, immediatly following the :attr:`rssi`"""
-        return self.id_data[9]
+        RSSI, immediatly following the :attr:`source_address`
 
-    @property
-    def sample_count(self):
-        """Sample count, immediatly following the :attr:`options`"""
-        return self.id_data[10]
+    .. attribute:: options
+
+        Options, immediatly following the :attr:`rssi`
+
+    .. attribute:: sample_count
+
+        Sample count, immediatly following the :attr:`options`
+
+    """
+    api_id = RX_64_IO_RESPONSE
+    layout = (('source_address', 'Q'), ('rssi', 'B'), ('options', 'B'), ('sample_count', 'B'), ('_channel_mask', 'H'))
+    __slots__ = ()
 
     @property
     def analog_mask(self):
@@ -163,7 +248,7 @@ class Rx64IoSampleResponse(XBeeResponse):
         for A1 and so on until seventh bit which is for A5
 
         """
-        return self.id_data[11] & 0x3e
+        return (self._channel_mask >> 8) & 0x3e
 
     @property
     def digital_mask(self):
@@ -176,7 +261,7 @@ class Rx64IoSampleResponse(XBeeResponse):
         for D8
 
         """
-        return unpack('>H', self.id_data[11:13])[0] & 0x01ff
+        return self._channel_mask & 0x01ff
 
     @property
     def contains_analog(self):
@@ -219,10 +304,8 @@ class Rx64IoSampleResponse(XBeeResponse):
         """
         if not self.is_digital_enabled(pin):
             raise ValueError('Digital pin %d is not enabled' % pin)
-        offset = index * 2
-        if self.contains_analog:
-            offset += index * 2 * bitcount(self.analog_mask)
-        sample = unpack('>H', self.id_data[13 + offset:15 + offset])[0]
+        offset = index * 2 * (1 + _BITCOUNTS[self.analog_mask])
+        sample = _UINT16.unpack_from(self.frame, 17 + offset)[0]
         return (sample >> pin) & 1 == 1
 
     def get_analog(self, index, pin):
@@ -234,15 +317,28 @@ class Rx64IoSampleResponse(XBeeResponse):
         :rtype: int
 
         """
-        if not self.is_analog_enabled(pin):
+        analog_mask = self.analog_mask
+        if not (analog_mask >> pin + 1) & 1:
             raise ValueError('Analog pin %d is not enabled' % pin)
-        offset = index * 2 * bitcount(self.analog_mask)
-        if self.contains_digital:
-            offset += 2 + index * 2
-        for i in range(pin):
-            if self.is_analog_enabled(i):
-                offset += 2
-        return unpack('>H', self.id_data[13 + offset:15 + offset])[0]
+        digital = 1 if self.digital_mask else 0
+        offset = 2 * (index * (digital + _BITCOUNTS[analog_mask]) + digital + _PIN_OFFSETS[analog_mask][pin + 1])
+        return _UINT16.unpack_from(self.frame, 17 + offset)[0]
+
+    def samples(self, numpy=False):
+        """Decode all the samples at once
+
+        Each sample is a row of which first column is the digital sample if
+        :attr:`contains_digital` followed by the values of enabled analog pins
+        in increasing pin order
+
+        :param bool numpy: return a NumPy array instead of an :class:`array.array`
+        :return: the samples, flat row after row for an :class:`array.array` or with
+            shape ``(sample_count, channels)`` for a NumPy array
+        :rtype: :class:`array.array` of type ``'H'`` or :class:`numpy.ndarray`
+
+        """
+        channels = _BITCOUNTS[self.analog_mask] + (1 if self.contains_digital else 0)
+        return _decode_samples(self.id_data[13:], self.sample_count, channels, numpy)
 
 
 class Rx16IoSampleResponse(XBeeResponse):
@@ -250,28 +346,26 @@ class Rx16IoSampleResponse(XBeeResponse):
 
     Frame example: 7E 00 14 83 7D 84 23 01 02 14 88 00 80 00 8F 03 ED 00 08 02 4C 00 0C 58
 
-    """
-    api_id = RX_16_IO_RESPONSE
+    .. attribute:: source_address
 
-    @property
-    def source_address(self):
-        """Source address, first 2 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>H', self.id_data[0:2])[0]
+        Source address, first 2 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def rssi(self):
-        """RSSI, immediatly following the :attr:`source_address`"""
-        return self.id_data[2]
+    .. attribute:: rssi
 
-    @property
-    def options(self):
-        """Options, immediatly following the :attr:`rssi`"""
-        return self.id_data[3]
+        RSSI, immediatly following the :attr:`source_address`
 
-    @property
-    def sample_count(self):
-        """Sample count, immediatly following the :attr:`options`"""
-        return self.id_data[4]
+    .. attribute:: options
+
+        Options, immediatly following the :attr:`rssi`
+
+    .. attribute:: sample_count
+
+        Sample count, immediatly following the :attr:`options`
+
+    """
+    api_id = RX_16_IO_RESPONSE
+    layout = (('source_address', 'H'), ('rssi', 'B'), ('options', 'B'), ('sample_count', 'B'), ('_channel_mask', 'H'))
+    __slots__ = ()
 
     @property
     def analog_mask(self):
@@ -283,7 +377,7 @@ class Rx16IoSampleResponse(XBeeResponse):
         for A1 and so on until seventh bit which is for A5
 
         """
-        return self.id_data[5] & 0x3e
+        return (self._channel_mask >> 8) & 0x3e
 
     @property
     def digital_mask(self):
@@ -296,7 +390,7 @@ class Rx16IoSampleResponse(XBeeResponse):
         for D8
 
         """
-        return unpack('>H', self.id_data[5:7])[0] & 0x01ff
+        return self._channel_mask & 0x01ff
 
     @property
     def contains_analog(self):
@@ -339,10 +433,8 @@ class Rx16IoSampleResponse(XBeeResponse):
         """
         if not self.is_digital_enabled(pin):
             raise ValueError('Digital pin %d is not enabled' % pin)
-        offset = index * 2
-        if self.contains_analog:
-            offset += index * 2 * bitcount(self.analog_mask)
-        sample = unpack('>H', self.id_data[7 + offset:9 + offset])[0]
+        offset = index * 2 * (1 + _BITCOUNTS[self.analog_mask])
+        sample = _UINT16.unpack_from(self.frame, 11 + offset)[0]
         return (sample >> pin) & 1 == 1
 
     def get_analog(self, index, pin):
@@ -354,15 +446,28 @@ class Rx16IoSampleResponse(XBeeResponse):
         :rtype: int
 
         """
-        if not self.is_analog_enabled(pin):
+        analog_mask = self.analog_mask
+        if not (analog_mask >> pin + 1) & 1:
             raise ValueError('Analog pin %d is not enabled' % pin)
-        offset = index * 2 * bitcount(self.analog_mask)
-        if self.contains_digital:
-            offset += 2 + index * 2
-        for i in range(pin):
-            if self.is_analog_enabled(i):
-                offset += 2
-        return unpack('>H', self.id_data[7 + offset:9 + offset])[0]
+        digital = 1 if self.digital_mask else 0
+        offset = 2 * (index * (digital + _BITCOUNTS[analog_mask]) + digital + _PIN_OFFSETS[analog_mask][pin + 1])
+        return _UINT16.unpack_from(self.frame, 11 + offset)[0]
+
+    def samples(self, numpy=False):
+        """Decode all the samples at once
+
+        Each sample is a row of which first column is the digital sample if
+        :attr:`contains_digital` followed by the values of enabled analog pins
+        in increasing pin order
+
+        :param bool numpy: return a NumPy array instead of an :class:`array.array`
+        :return: the samples, flat row after row for an :class:`array.array` or with
+            shape ``(sample_count, channels)`` for a NumPy array
+        :rtype: :class:`array.array` of type ``'H'`` or :class:`numpy.ndarray`
+
+        """
+        channels = _BITCOUNTS[self.analog_mask] + (1 if self.contains_digital else 0)
+        return _decode_samples(self.id_data[7:], self.sample_count, channels, numpy)
 
 
 class AtResponse(XBeeResponse):
@@ -370,23 +475,22 @@ class AtResponse(XBeeResponse):
 
     Frame example: 7E 00 07 88 52 4D 59 00 00 00 7F
 
-    """
-    api_id = AT_RESPONSE
+    .. attribute:: frame_id
 
-    @property
-    def frame_id(self):
-        """Frame Id, first byte of the :attr:`~XBeeResponse.id_data`"""
-        return self.id_data[0]
+        Frame Id, first byte of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def command(self):
-        """Command, on 2 bytes immediately following the :attr:`frame_id`"""
-        return bytes(self.id_data[1:3])
+    .. attribute:: command
 
-    @property
-    def status(self):
-        """Status, immediately following the :attr:`command`"""
-        return self.id_data[3]
+        Command, on 2 bytes immediately following the :attr:`frame_id`
+
+    .. attribute:: status
+
+        Status, immediately following the :attr:`command`
+
+    """
+    api_id = AT_RESPONSE
+    layout = (('frame_id', 'B'), ('command', '2s'), ('status', 'B'))
+    __slots__ = ()
 
     @property
     def value(self):
@@ -399,18 +503,19 @@ class TxStatusResponse(XBeeResponse):
 
     Frame example: 7E 00 03 89 2A 74 D8
 
-    """
-    api_id = TX_STATUS_RESPONSE
+    .. attribute:: frame_id
 
-    @property
-    def frame_id(self):
-        """Frame Id, first byte of the :attr:`~XBeeResponse.id_data`"""
-        return self.id_data[0]
+        Frame Id, first byte of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def status(self):
-        """Status, immediately following the :attr:`frame_id`"""
-        return self.id_data[1]
+    .. attribute:: status
+
+        Status, immediately following the :attr:`frame_id`
+
+    """
+    api_id = TX_STATUS_RESPONSE
+    layout = (('frame_id', 'B'), ('status', 'B'))
+    fixed_size = True
+    __slots__ = ()
 
 
 class ModemStatusResponse(XBeeResponse):
@@ -418,13 +523,15 @@ class ModemStatusResponse(XBeeResponse):
 
     Frame example: 7E 00 02 8A 06 6F
 
+    .. attribute:: status
+
+        Status, first byte of the :attr:`~XBeeResponse.id_data`
+
     """
     api_id = MODEM_STATUS_RESPONSE
-
-    @property
-    def status(self):
-        """Status, first byte of the :attr:`~XBeeResponse.id_data`"""
-        return self.id_data[0]
+    layout = (('status', 'B'),)
+    fixed_size = True
+    __slots__ = ()
 
 
 class ZBTxStatusResponse(XBeeResponse):
@@ -432,33 +539,32 @@ class ZBTxStatusResponse(XBeeResponse):
 
     Frame example: 7E 00 07 8B 01 7D 84 00 00 01 71
 
-    """
-    api_id = ZB_TX_STATUS_RESPONSE
+    .. attribute:: frame_id
 
-    @property
-    def frame_id(self):
-        """Frame Id, first byte of the :attr:`~XBeeResponse.id_data`"""
-        return self.id_data[0]
+        Frame Id, first byte of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def destination_address(self):
-        """Destination address, on 2 bytes immediately following the :attr:`frame_id`"""
-        return unpack('>H', self.id_data[1:3])[0]
+    .. attribute:: destination_address
 
-    @property
-    def retry_count(self):
-        """Retry count, immediately following the :attr:`destination_address`"""
-        return self.id_data[3]
+        Destination address, on 2 bytes immediately following the :attr:`frame_id`
 
-    @property
-    def delivery_status(self):
-        """Delivery status, immediately following the :attr:`retry_count`"""
-        return self.id_data[4]
+    .. attribute:: retry_count
 
-    @property
-    def discovery_status(self):
-        """Discovery status, immediately following the :attr:`delivery_status`"""
-        return self.id_data[5]
+        Retry count, immediately following the :attr:`destination_address`
+
+    .. attribute:: delivery_status
+
+        Delivery status, immediately following the :attr:`retry_count`
+
+    .. attribute:: discovery_status
+
+        Discovery status, immediately following the :attr:`delivery_status`
+
+    """
+    api_id = ZB_TX_STATUS_RESPONSE
+    layout = (('frame_id', 'B'), ('destination_address', 'H'), ('retry_count', 'B'), ('delivery_status', 'B'),
+              ('discovery_status', 'B'))
+    fixed_size = True
+    __slots__ = ()
 
 
 class ZBRxResponse(XBeeResponse):
@@ -466,23 +572,22 @@ class ZBRxResponse(XBeeResponse):
 
     Frame example: 7E 00 12 90 00 13 A2 00 40 52 2B AA 7D 84 01 52 78 44 61 74 61 0D
 
-    """
-    api_id = ZB_RX_RESPONSE
+    .. attribute:: source_address_64
 
-    @property
-    def source_address_64(self):
-        """64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>Q', self.id_data[0:8])[0]
+        64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def source_address_16(self):
-        """16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`"""
-        return unpack('>H', self.id_data[8:10])[0]
+    .. attribute:: source_address_16
 
-    @property
-    def options(self):
-        """Options, immediately following the :attr:`source_address_16`"""
-        return self.id_data[10]
+        16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`
+
+    .. attribute:: options
+
+        Options, immediately following the :attr:`source_address_16`
+
+    """
+    api_id = ZB_RX_RESPONSE
+    layout = (('source_address_64', 'Q'), ('source_address_16', 'H'), ('options', 'B'))
+    __slots__ = ()
 
     @property
     def data(self):
@@ -495,43 +600,39 @@ class ZBExplicitRxResponse(XBeeResponse):
 
     Frame example: 7E 00 18 91 00 13 A2 00 40 52 2B AA 7D 84 E0 E0 22 11 C1 05 02 52 78 44 61 74 61 52
 
-    """
-    api_id = ZB_EXPLICIT_RX_RESPONSE
+    .. attribute:: source_address_64
 
-    @property
-    def source_address_64(self):
-        """64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>Q', self.id_data[0:8])[0]
+        64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def source_address_16(self):
-        """16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`"""
-        return unpack('>H', self.id_data[8:10])[0]
+    .. attribute:: source_address_16
 
-    @property
-    def source_endpoint(self):
-        """Source endpoint, immediately following the :attr:`source_address_16`"""
-        return self.id_data[10]
+        16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`
 
-    @property
-    def destination_endpoint(self):
-        """Destination endpoint, immediately following the :attr:`source_endpoint`"""
-        return self.id_data[11]
+    .. attribute:: source_endpoint
 
-    @property
-    def cluster_id(self):
-        """Cluster id, on 2 bytes immediately following the :attr:`destination_endpoint`"""
-        return unpack('>H', self.id_data[12:14])[0]
+        Source endpoint, immediately following the :attr:`source_address_16`
 
-    @property
-    def profile_id(self):
-        """Profile id, on 2 bytes immediately following the :attr:`cluster_id`"""
-        return unpack('>H', self.id_data[14:16])[0]
+    .. attribute:: destination_endpoint
 
-    @property
-    def options(self):
-        """Options, immediately following the :attr:`profile_id`"""
-        return self.id_data[16]
+        Destination endpoint, immediately following the :attr:`source_endpoint`
+
+    .. attribute:: cluster_id
+
+        Cluster id, on 2 bytes immediately following the :attr:`destination_endpoint`
+
+    .. attribute:: profile_id
+
+        Profile id, on 2 bytes immediately following the :attr:`cluster_id`
+
+    .. attribute:: options
+
+        Options, immediately following the :attr:`profile_id`
+
+    """
+    api_id = ZB_EXPLICIT_RX_RESPONSE
+    layout = (('source_address_64', 'Q'), ('source_address_16', 'H'), ('source_endpoint', 'B'), ('destination_endpoint', 'B'),
+              ('cluster_id', 'H'), ('profile_id', 'H'), ('options', 'B'))
+    __slots__ = ()
 
     @property
     def data(self):
@@ -544,38 +645,35 @@ class ZBIoSampleResponse(XBeeResponse):
 
     Frame example: 7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 02 00 14 02 25 F5
 
-    """
-    api_id = ZB_IO_SAMPLE_RESPONSE
+    .. attribute:: source_address_64
 
-    @property
-    def source_address_64(self):
-        """64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`"""
-        return unpack('>Q', self.id_data[0:8])[0]
+        64-bits source address, first 8 bytes of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def source_address_16(self):
-        """16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`"""
-        return unpack('>H', self.id_data[8:10])[0]
+    .. attribute:: source_address_16
 
-    @property
-    def options(self):
-        """Options, immediately following the :attr:`source_address_16`"""
-        return self.id_data[10]
+        16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`
 
-    @property
-    def sample_count(self):
-        """Sample count, immediately following the :attr:`options`"""
-        return self.id_data[11]
+    .. attribute:: options
 
-    @property
-    def digital_mask(self):
-        """Digital mask, on 2 bytes, immediately following the :attr:`sample_count`"""
-        return unpack('>H', self.id_data[12:14])[0] & 0x3cff
+        Options, immediately following the :attr:`source_address_16`
 
-    @property
-    def analog_mask(self):
-        """Analog mask, immediately following the :attr:`digital_mask`"""
-        return self.id_data[14] & 0x8f
+    .. attribute:: sample_count
+
+        Sample count, immediately following the :attr:`options`
+
+    .. attribute:: digital_mask
+
+        Digital mask, on 2 bytes, immediately following the :attr:`sample_count`
+
+    .. attribute:: analog_mask
+
+        Analog mask, immediately following the :attr:`digital_mask`
+
+    """
+    api_id = ZB_IO_SAMPLE_RESPONSE
+    layout = (('source_address_64', 'Q'), ('source_address_16', 'H'), ('options', 'B'), ('sample_count', 'B'),
+              ('digital_mask', 'H', 0x3cff), ('analog_mask', 'B', 0x8f))
+    __slots__ = ()
 
     @property
     def contains_digital(self):
@@ -617,7 +715,7 @@ class ZBIoSampleResponse(XBeeResponse):
         """
         if not self.is_digital_enabled(pin):
             raise ValueError('Digital pin %d is not enabled' % pin)
-        sample = unpack('>H', self.id_data[15:17])[0]
+        sample = _UINT16.unpack_from(self.frame, 19)[0]
         return (sample >> pin) & 1 == 1
 
     def get_analog(self, pin):
@@ -628,15 +726,11 @@ class ZBIoSampleResponse(XBeeResponse):
         :rtype: int
 
         """
-        if not self.is_analog_enabled(pin):
+        analog_mask = self.analog_mask
+        if not (analog_mask >> pin) & 1:
             raise ValueError('Analog pin %d is not enabled' % pin)
-        offset = 0
-        if self.contains_digital:
-            offset += 2
-        for i in range(pin):
-            if self.is_analog_enabled(i):
-                offset += 2
-        return unpack('>H', self.id_data[15 + offset:17 + offset])[0]
+        offset = 2 * ((1 if self.digital_mask else 0) + _PIN_OFFSETS[analog_mask][pin])
+        return _UINT16.unpack_from(self.frame, 19 + offset)[0]
 
     @property
     def supply_voltage(self):
@@ -656,33 +750,30 @@ class RemoteAtResponse(XBeeResponse):
 
     Frame example: 7E 00 13 97 55 00 13 A2 00 40 52 2B AA 7D 84 53 4C 00 40 52 2B AA F0
 
-    """
-    api_id = REMOTE_AT_RESPONSE
+    .. attribute:: frame_id
 
-    @property
-    def frame_id(self):
-        """Frame Id, first byte of the :attr:`~XBeeResponse.id_data`"""
-        return self.id_data[0]
+        Frame Id, first byte of the :attr:`~XBeeResponse.id_data`
 
-    @property
-    def source_address_64(self):
-        """64-bits source address, on 8 bytes immediately following the :attr:`frame_id`"""
-        return unpack('>Q', self.id_data[1:9])[0]
+    .. attribute:: source_address_64
 
-    @property
-    def source_address_16(self):
-        """16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`"""
-        return unpack('>H', self.id_data[9:11])[0]
+        64-bits source address, on 8 bytes immediately following the :attr:`frame_id`
 
-    @property
-    def command(self):
-        """Command, on two bytes immediately following the :attr:`source_address_16`"""
-        return bytes(self.id_data[11:13])
+    .. attribute:: source_address_16
 
-    @property
-    def status(self):
-        """Status, immediately following the :attr:`command`"""
-        return self.id_data[13]
+        16-bits source address, on 2 bytes immediately following the :attr:`source_address_64`
+
+    .. attribute:: command
+
+        Command, on two bytes immediately following the :attr:`source_address_16`
+
+    .. attribute:: status
+
+        Status, immediately following the :attr:`command`
+
+    """
+    api_id = REMOTE_AT_RESPONSE
+    layout = (('frame_id', 'B'), ('source_address_64', 'Q'), ('source_address_16', 'H'), ('command', '2s'), ('status', 'B'))
+    __slots__ = ()
 
     @property
     def data(self):
@@ -699,6 +790,58 @@ RESPONSE_MAP = {c.api_id: c for c in (Rx64Response, Rx16Response, Rx64IoSampleRe
                                       ZBIoSampleResponse, RemoteAtResponse)}
 
 
+class FrameView(object):
+    """Lightweight view of a raw API frame building its response on demand
+
+    The :attr:`api_id`, :attr:`length` and raw :attr:`frame` are available right away and
+    the :class:`XBeeResponse` of the :attr:`api_id` in :data:`RESPONSE_MAP` is built when
+    any other attribute is first accessed
+
+    :param bytes frame: unescaped raw API frame
+
+    """
+    __slots__ = ('frame', '_response')
+
+    def __init__(self, frame):
+        #: Unescaped raw API frame
+        self.frame = frame
+
+        self._response = None
+
+    @property
+    def api_id(self):
+        """API ID"""
+        return self.frame[3]
+
+    @property
+    def length(self):
+        """Length, on 2 bytes starting right after the :data:`~hachi.const.FRAME_DELIMITER` of the :attr:`frame`"""
+        return (self.frame[1] << 8) + self.frame[2]
+
+    @property
+    def response(self):
+        """Response of the frame, built on first access
+
+        :type: :class:`XBeeResponse`
+
+        """
+        if self._response is None:
+            self._response = RESPONSE_MAP[self.frame[3]](self.frame)
+        return self._response
+
+    def __getattr__(self, name):
+        # only called when the attribute is not set, delegate public attributes to the response
+        if name.startswith('_') or name in ('frame', 'response'):
+            raise AttributeError('%r object has no attribute %r' % (type(self).__name__, name))
+        return getattr(self.response, name)
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return '<%s(api_id=0x%02x, len=%d)>' % (self.__class__.__name__, self.api_id, self.length)
+
+
 def bitcount(number):
     """Count the number of bits to 1 in a number
 
@@ -716,6 +859,95 @@ def bitcount(number):
     """
     count = 0
     while number:
-        count += number & 1
-        number >>= 1
+        count += _BITCOUNTS[number & 0xff]
+        number >>= 8
     return count
+
+
+def decode_zb_io_samples(frames, numpy=False, fill=0xffff):
+    """Decode many :class:`ZBIoSampleResponse` in columns
+
+    Columns are aligned: the n-th value of each column comes from the n-th frame. They are
+    ``source_address_64``, ``source_address_16``, ``digital_mask``, ``analog_mask``, ``digital``
+    for the digital sample and ``analog_0``, ``analog_1``, ``analog_2``, ``analog_3`` and
+    ``analog_7`` for the analog pins, pin 7 being the supply voltage. Missing samples,
+    according to the masks, are set to `fill` or to NaN with NumPy
+
+    :param frames: responses or their unescaped raw API frames
+    :type frames: iterable of :class:`ZBIoSampleResponse` or bytes or bytearray or memoryview
+    :param bool numpy: return NumPy arrays instead of :class:`array.array`, samples being float
+        arrays to hold NaN
+    :param int fill: value of missing samples in :class:`array.array`
+    :raise: ValueError if a frame is not a :data:`~hachi.const.ZB_IO_SAMPLE_RESPONSE`
+    :return: the columns by name
+    :rtype: dict of :class:`array.array` or :class:`numpy.ndarray`
+
+    """
+    layout = _compile(ZBIoSampleResponse)
+    digital_mask_mask, analog_mask_mask = layout.masks[4:6]
+    columns = {'source_address_64': array('Q'), 'source_address_16': array('H'),
+               'digital_mask': array('H'), 'analog_mask': array('B'), 'digital': array('H')}
+    analog = tuple((pin, columns.setdefault('analog_%d' % pin, array('H'))) for pin in (0, 1, 2, 3, 7))
+    for frame in frames:
+        if isinstance(frame, ZBIoSampleResponse):
+            frame = frame.frame
+        if frame[3] != ZB_IO_SAMPLE_RESPONSE:
+            raise ValueError('Frame with wrong API ID')
+        source_address_64, source_address_16, _, _, digital_mask, analog_mask = layout.struct.unpack_from(frame, 4)
+        digital_mask &= digital_mask_mask
+        analog_mask &= analog_mask_mask
+        columns['source_address_64'].append(source_address_64)
+        columns['source_address_16'].append(source_address_16)
+        columns['digital_mask'].append(digital_mask)
+        columns['analog_mask'].append(analog_mask)
+        samples = _UINT16S[(1 if digital_mask else 0) + _BITCOUNTS[analog_mask]].unpack_from(frame, 19)
+        if digital_mask:
+            columns['digital'].append(samples[0])
+        else:
+            columns['digital'].append(fill)
+        for pin, column in analog:
+            if (analog_mask >> pin) & 1:
+                column.append(samples[(1 if digital_mask else 0) + _PIN_OFFSETS[analog_mask][pin]])
+            else:
+                column.append(fill)
+    if not numpy:
+        return columns
+    import numpy
+    result = dict((name, numpy.array(column, dtype=column.typecode)) for name, column in columns.items())
+    result['digital'] = numpy.where(result['digital_mask'] != 0, result['digital'], numpy.nan)
+    for pin, _ in analog:
+        name = 'analog_%d' % pin
+        result[name] = numpy.where((result['analog_mask'] >> pin) & 1 != 0, result[name], numpy.nan)
+    return result
+
+
+#: Number of bits to 1 for each byte
+_BITCOUNTS = tuple(bin(byte).count('1') for byte in range(256))
+
+#: Number of bits to 1 below each of the 8 bits of each byte, channel offsets of enabled pins in a mask
+_PIN_OFFSETS = tuple(tuple(_BITCOUNTS[mask & ((1 << pin) - 1)] for pin in range(8)) for mask in range(256))
+
+#: Unsigned 16-bit big-endian sample
+_UINT16 = Struct('>H')
+
+#: Unsigned 16-bit big-endian samples by number of samples
+_UINT16S = tuple(Struct('>%dH' % count) for count in range(7))
+
+
+def _decode_samples(block, sample_count, channels, numpy):
+    """Decode a block of big-endian 16-bit samples, see :meth:`Rx64IoSampleResponse.samples`"""
+    size = sample_count * channels
+    if len(block) < size * 2:
+        raise ValueError('Samples are truncated')
+    if numpy:
+        import numpy
+        return numpy.frombuffer(block, dtype='>u2', count=size).reshape(sample_count, channels)
+    samples = array('H', bytes(block[:size * 2]))
+    if sys.byteorder == 'little':
+        samples.byteswap()
+    return samples
+
+
+#: Mapping from :ref:`response_api_ids` to the minimum and maximum, `None` if unbounded, length of the frames
+LENGTH_MAP = {api_id: (1 + _compile(cls).struct.size, 1 + _compile(cls).struct.size if cls.fixed_size else None)
+              for api_id, cls in RESPONSE_MAP.items()}
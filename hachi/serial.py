@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
-from __future__ import absolute_import, unicode_literals
-from .core import XBee, escape_frame
-from .exceptions import Timeout
-from serial import Serial
+from .const import API_MODE_ESCAPED, OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_API_IDS
+from .core import XBee, encode_frames, escape_frame
+from .exceptions import Closed, Timeout
+from collections import deque
+from serial import serial_for_url
+import logging
+import threading
+import time
 
 
-__all__ = ['XBeeSerial']
+__all__ = ['XBeeSerial', 'ResponseQueue', 'SendHandle']
+logger = logging.getLogger(__name__)
 
 
 class XBeeSerial(XBee):
@@ -13,42 +18,449 @@ class XBeeSerial(XBee):
 
     .. _pySerial's documentation: http://pyserial.sourceforge.net/
 
-    :param port: serial port name or number. See `pySerial's documentation`_ for more details
-    :type port: str or int
+    :param str port: serial port name or URL. See `pySerial's documentation`_ for more details
     :param int baudrate: serial baudrate. See `pySerial's documentation`_ for more details
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :param max_length: maximum length of the frames, see :class:`~hachi.core.XBee`
+    :type max_length: None or int
+    :param correlator: correlator of the requests sent, see :class:`~hachi.core.XBee`
+    :type correlator: None or :class:`~hachi.correlation.Correlator`
+
+    Optionally, a reader thread started with :meth:`start_reader` continuously reads and parses
+    the incoming data into a :class:`ResponseQueue` so the serial port is drained however slow
+    the consumers are. Likewise, a writer thread started with :meth:`start_writer` writes the
+    frames sent from many threads so they are never interleaved. The reader thread also expires
+    the requests of the :attr:`~hachi.core.XBee.correlator` whose timeout is exceeded, at least
+    every :attr:`reader_timeout`.
 
     """
-    def __init__(self, port, baudrate=9600):
-        super(XBeeSerial, self).__init__()
-        self.serial = Serial(port, baudrate)
+    #: Timeout of the reads of the reader thread, in seconds, bounding the time to stop it
+    reader_timeout = 0.1
+
+    def __init__(self, port, baudrate=9600, api_mode=API_MODE_ESCAPED, max_length=None, correlator=None):
+        self._responses = deque()
+        super(XBeeSerial, self).__init__(self._responses.append, api_mode, max_length=max_length, correlator=correlator)
+        self.serial = serial_for_url(port, baudrate)
+
+        #: :class:`ResponseQueue` filled by the reader thread, `None` until :meth:`start_reader`
+        self.responses = None
+        self._reader = None
+        self._reader_stop = threading.Event()
+        self._writer = None
+        self._writer_stop = False
+        self._pending = deque()
+        self._pending_condition = threading.Condition()
+        self._write_lock = threading.Lock()
 
     def read_response(self, timeout=None):
         """Read response from serial
 
+        All the bytes waiting are read at once and fed to the parser. Responses and partial
+        frames following the response are kept for the next calls
+
         :param timeout: timeout in seconds. See `pySerial's documentation`_ for more details
         :type timeout: None or int or float
         :raise: :class:`~hachi.exceptions.Timeout` when timeout is exceeded
 
 
         """
-        self.reset()
+        if self._reader is not None:
+            return self.responses.get(timeout)
         self.serial.timeout = timeout
-        while self.response is None:
-            char = self.serial.read()
-            if not char:
+        while not self._responses:
+            data = self.serial.read(max(1, self.serial.in_waiting))
+            if not data:
                 raise Timeout
-            self.feed(ord(char))
-        return self.response
+            self.feed(data)
+        return self._responses.popleft()
+
+    def read_responses(self, max_count=None, timeout=None):
+        """Read all the available responses from serial
+
+        Responses already received are returned first, along with the ones in the bytes waiting
+        on the serial port. When there is none, wait for the first one until the `timeout`
+
+        :param max_count: maximum number of responses to return, the others being kept for the
+            next calls
+        :type max_count: None or int
+        :param timeout: timeout in seconds. See `pySerial's documentation`_ for more details
+        :type timeout: None or int or float
+        :return: the responses, empty when timeout is exceeded
+        :rtype: list of :class:`~hachi.response.XBeeResponse`
+
+        """
+        if self._reader is not None:
+            return self.responses.get_many(max_count, timeout)
+        self.serial.timeout = timeout
+        waiting = self.serial.in_waiting
+        while waiting or not self._responses:
+            data = self.serial.read(max(1, waiting))
+            if not data:
+                break
+            self.feed(data)
+            waiting = self.serial.in_waiting
+        count = len(self._responses)
+        if max_count is not None:
+            count = min(count, max_count)
+        return [self._responses.popleft() for _ in range(count)]
 
     def send(self, request):
         """Send a :class:`~hachi.request.XBeeRequest` through serial
 
+        When the writer thread is started, the frame is queued and a :class:`SendHandle`
+        is returned immediately
+
         :param request: the request to send
         :type request: :class:`~hachi.request.XBeeRequest`
+        :return: the handle of the queued frame if the writer thread is started
+        :rtype: None or :class:`SendHandle`
+
+        """
+        if self.api_mode == API_MODE_ESCAPED:
+            return self._write(escape_frame(request.frame))
+        return self._write(request.frame)
+
+    def send_many(self, requests):
+        """Send many :class:`~hachi.request.XBeeRequest` through serial at once
+
+        Requests are encoded with :func:`~hachi.core.encode_frames` and written in a single call
+
+        :param requests: the requests to send
+        :type requests: iterable of :class:`~hachi.request.XBeeRequest`
+        :return: the handle of the queued frames if the writer thread is started
+        :rtype: None or :class:`SendHandle`
+
+        """
+        return self._write(encode_frames(requests, self.api_mode))
+
+    def _write(self, data):
+        """Write encoded frames or queue them for the writer thread
+
+        Once the writer thread is stopping, frames are written directly after it wrote the
+        frames queued before
+
+        :param bytearray data: the encoded frames
+        :return: the handle of the frames if the writer thread is started
+        :rtype: None or :class:`SendHandle`
 
         """
-        self.serial.write(escape_frame(request.frame))
+        with self._pending_condition:
+            writer = self._writer
+            if writer is not None and not self._writer_stop:
+                handle = SendHandle()
+                self._pending.append((data, handle))
+                self._pending_condition.notify()
+                return handle
+        if writer is None:
+            with self._write_lock:
+                self.serial.write(data)
+            return None
+        writer.join()
+        handle = SendHandle()
+        try:
+            with self._write_lock:
+                self.serial.write(data)
+        except Exception as e:
+            logger.exception('Failed to write %d byte(s) while the writer thread is stopping', len(data))
+            handle._complete(e)
+        else:
+            handle._complete()
+        return handle
+
+    def start_reader(self, maxsize=0, overflow=OVERFLOW_BLOCK, drop_api_ids=()):
+        """Start the reader thread
+
+        Responses already received are moved to the :attr:`responses` queue and
+        :meth:`read_response` and :meth:`read_responses` read from it until :meth:`stop_reader`
+
+        :param int maxsize: maximum number of responses in the queue, unbounded if 0
+        :param int overflow: overflow policy of the queue, see :class:`ResponseQueue`
+        :param drop_api_ids: API IDs of the responses that can be dropped
+        :type drop_api_ids: iterable of int
+        :return: the queue of responses
+        :rtype: :class:`ResponseQueue`
+
+        """
+        if self._reader is not None:
+            raise RuntimeError('Reader already started')
+        self.responses = ResponseQueue(maxsize, overflow, drop_api_ids)
+        while self._responses:
+            self.responses.put(self._responses.popleft())
+        self.callback = self.responses.put
+        self.serial.timeout = self.reader_timeout
+        self._reader_stop.clear()
+        self._reader = threading.Thread(target=self._read_forever, name='XBeeSerial reader')
+        self._reader.daemon = True
+        self._reader.start()
+        return self.responses
+
+    def stop_reader(self):
+        """Stop the reader thread and close the :attr:`responses` queue
+
+        Responses left in the queue can still be read from it
+
+        """
+        if self._reader is None:
+            return
+        self._reader_stop.set()
+        self.responses.close()  # wake up the reader thread blocked on a full queue
+        self._reader.join()
+        self._reader = None
+        self.callback = self._responses.append
+
+    def start_writer(self):
+        """Start the writer thread
+
+        Until :meth:`stop_writer`, :meth:`send` and :meth:`send_many` can be called from many
+        threads: frames are encoded by the callers and queued, then the writer thread writes all
+        the queued frames at once, without holding the lock of the queue
+
+        """
+        with self._pending_condition:
+            if self._writer is not None:
+                raise RuntimeError('Writer already started')
+            self._writer_stop = False
+            self._writer = threading.Thread(target=self._write_forever, name='XBeeSerial writer')
+            self._writer.daemon = True
+            self._writer.start()
+
+    def stop_writer(self):
+        """Stop the writer thread once the queued frames are written"""
+        with self._pending_condition:
+            writer = self._writer
+            if writer is None:
+                return
+            self._writer_stop = True
+            self._pending_condition.notify()
+        writer.join()
+        with self._pending_condition:
+            self._writer = None
+
+    def _write_forever(self):
+        """Write the queued frames until :meth:`stop_writer`, in the writer thread"""
+        while True:
+            with self._pending_condition:
+                while not self._pending and not self._writer_stop:
+                    self._pending_condition.wait()
+                if not self._pending:
+                    return
+                pending, self._pending = self._pending, deque()
+            error = None
+            try:
+                with self._write_lock:
+                    self.serial.write(bytearray().join(data for data, _ in pending))
+            except Exception as e:
+                logger.exception('Writer thread failed to write %d frame(s)', len(pending))
+                error = e
+            for _, handle in pending:
+                handle._complete(error)
+
+    def _read_forever(self):
+        """Read and parse the incoming data until :meth:`stop_reader`, in the reader thread
+
+        Errors while parsing, including those of the handlers, are logged and the partial frame
+        discarded. Errors while reading stop the thread and close the :attr:`responses` queue.
+        Requests of the :attr:`~hachi.core.XBee.correlator` are expired after each read
+
+        """
+        try:
+            while not self._reader_stop.is_set():
+                data = self.serial.read(max(1, self.serial.in_waiting))
+                if self.correlator is not None:
+                    self.correlator.expire()
+                if not data:
+                    continue
+                try:
+                    self.feed(data)
+                except Exception:
+                    logger.exception('Reader thread failed to parse %d byte(s)', len(data))
+                    self.reset()
+        except Exception:
+            logger.exception('Reader thread failed')
+        finally:
+            self.responses.close()
 
     def close(self):
-        """Close the serial port"""
+        """Stop the reader and writer threads, if any, and close the serial port"""
+        self.stop_reader()
+        self.stop_writer()
         self.serial.close()
+
+
+class ResponseQueue(object):
+    """Bounded FIFO of responses shared between threads
+
+    When the queue is full, the `overflow` policy applies:
+
+    * :data:`~hachi.const.OVERFLOW_BLOCK`: the producer blocks until there is room
+    * :data:`~hachi.const.OVERFLOW_DROP_OLDEST`: the oldest response is dropped
+    * :data:`~hachi.const.OVERFLOW_DROP_API_IDS`: the oldest response with an API ID in
+      `drop_api_ids` is dropped, or the new one if its API ID is in `drop_api_ids`.
+      Otherwise the producer blocks until there is room
+
+    Iterating over the queue yields the responses until it is closed and empty.
+
+    :param int maxsize: maximum number of responses, unbounded if 0
+    :param int overflow: overflow policy
+    :param drop_api_ids: API IDs of the responses that can be dropped
+    :type drop_api_ids: iterable of int
+
+    """
+    def __init__(self, maxsize=0, overflow=OVERFLOW_BLOCK, drop_api_ids=()):
+        #: Maximum number of responses
+        self.maxsize = maxsize
+
+        #: Overflow policy
+        self.overflow = overflow
+
+        #: API IDs of the responses that can be dropped
+        self.drop_api_ids = frozenset(drop_api_ids)
+
+        #: Number of dropped responses
+        self.dropped = 0
+
+        #: Whether the queue is closed
+        self.closed = False
+
+        self._responses = deque()
+        self._condition = threading.Condition()
+
+    def put(self, response):
+        """Put a response in the queue, applying the overflow policy when full
+
+        :param response: the response
+        :type response: :class:`~hachi.response.XBeeResponse`
+
+        """
+        with self._condition:
+            while self.maxsize and len(self._responses) >= self.maxsize and not self.closed:
+                if self.overflow == OVERFLOW_DROP_OLDEST:
+                    self._responses.popleft()
+                elif self.overflow == OVERFLOW_DROP_API_IDS and self._drop_api_ids():
+                    pass
+                elif self.overflow == OVERFLOW_DROP_API_IDS and response.api_id in self.drop_api_ids:
+                    self.dropped += 1
+                    return
+                else:
+                    self._condition.wait()
+                    continue
+                self.dropped += 1
+            self._responses.append(response)
+            self._condition.notify_all()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest response
+
+        :param timeout: timeout in seconds, `None` to wait forever
+        :type timeout: None or int or float
+        :raise: :class:`~hachi.exceptions.Timeout` when timeout is exceeded
+        :raise: :class:`~hachi.exceptions.Closed` when the queue is closed and empty
+        :rtype: :class:`~hachi.response.XBeeResponse`
+
+        """
+        with self._condition:
+            self._wait(timeout)
+            if self._responses:
+                response = self._responses.popleft()
+                self._condition.notify_all()
+                return response
+            if self.closed:
+                raise Closed
+            raise Timeout
+
+    def get_many(self, max_count=None, timeout=None):
+        """Remove and return all the responses, waiting for the first one until the `timeout`
+
+        :param max_count: maximum number of responses to return
+        :type max_count: None or int
+        :param timeout: timeout in seconds, `None` to wait forever
+        :type timeout: None or int or float
+        :return: the responses, empty when timeout is exceeded or the queue is closed
+        :rtype: list of :class:`~hachi.response.XBeeResponse`
+
+        """
+        with self._condition:
+            self._wait(timeout)
+            count = len(self._responses)
+            if max_count is not None:
+                count = min(count, max_count)
+            responses = [self._responses.popleft() for _ in range(count)]
+            self._condition.notify_all()
+            return responses
+
+    def close(self):
+        """Close the queue, waking up the consumers"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def _wait(self, timeout):
+        """Wait until there is a response or the queue is closed, with the condition acquired"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._responses and not self.closed:
+            if deadline is None:
+                self._condition.wait()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._condition.wait(remaining)
+
+    def _drop_api_ids(self):
+        """Drop the oldest response with an API ID in :attr:`drop_api_ids`, with the condition acquired
+
+        :return: whether a response was dropped
+        :rtype: bool
+
+        """
+        for index, response in enumerate(self._responses):
+            if response.api_id in self.drop_api_ids:
+                del self._responses[index]
+                return True
+        return False
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get()
+            except Closed:
+                return
+
+    def __len__(self):
+        with self._condition:
+            return len(self._responses)
+
+
+class SendHandle(object):
+    """Completion handle of frames queued for the writer thread of :class:`XBeeSerial`"""
+    def __init__(self):
+        #: Exception raised while writing the frames, if any
+        self.error = None
+
+        self._event = threading.Event()
+
+    @property
+    def done(self):
+        """Whether the frames were written, or failed to"""
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the frames are written
+
+        :param timeout: timeout in seconds, `None` to wait forever
+        :type timeout: None or int or float
+        :raise: :class:`~hachi.exceptions.Timeout` when timeout is exceeded
+        :raise: the :attr:`error` if writing failed
+
+        """
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise Timeout
+        if self.error is not None:
+            raise self.error
+
+    def _complete(self, error=None):
+        """Mark the frames as written, in the writer thread"""
+        self.error = error
+        self._event.set()
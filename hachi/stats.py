@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import json
+
+
+__all__ = ['ParserStats']
+
+
+class ParserStats(object):
+    """Health counters of an :class:`~hachi.core.XBee` parser
+
+    Counters are plain integers incremented by the parser as it goes so they are cheap
+    enough to be always on. Read them at once with :meth:`snapshot` or export them with
+    :meth:`to_json` and :meth:`to_prometheus`, for instance to alert on a degrading link
+    without enabling debug logging.
+
+    """
+    __slots__ = ('bytes_received', 'frames', 'skipped_frames', 'checksum_errors', 'unknown_api_ids', 'invalid_lengths',
+                 'discarded_bytes', 'truncated_frames', 'escaped_bytes', 'invalid_escapes')
+
+    #: Names of the integer counters, in the order they are exported
+    COUNTERS = ('bytes_received', 'skipped_frames', 'checksum_errors', 'unknown_api_ids', 'invalid_lengths', 'discarded_bytes',
+                'truncated_frames', 'escaped_bytes', 'invalid_escapes')
+
+    #: Description of the counters
+    DESCRIPTIONS = {
+        'bytes_received': 'Bytes fed to the parser',
+        'frames': 'Valid frames by API ID',
+        'skipped_frames': 'Frames skipped for lack of subscription',
+        'checksum_errors': 'Frames discarded for an invalid checksum',
+        'unknown_api_ids': 'Frames discarded for an unknown API ID',
+        'invalid_lengths': 'Frames discarded for an invalid length',
+        'discarded_bytes': 'Bytes discarded while waiting for a frame delimiter',
+        'truncated_frames': 'Frames interrupted by a frame delimiter before they were complete',
+        'escaped_bytes': 'Escaped bytes',
+        'invalid_escapes': 'Frames discarded for an invalid escape sequence',
+    }
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset all the counters to zero"""
+        #: Bytes fed to the parser
+        self.bytes_received = 0
+
+        #: Valid frames by API ID
+        self.frames = {}
+
+        #: Frames skipped for lack of subscription, see :attr:`~hachi.core.XBee.subscribed_only`
+        self.skipped_frames = 0
+
+        #: Frames discarded for an invalid checksum
+        self.checksum_errors = 0
+
+        #: Frames discarded for an unknown API ID
+        self.unknown_api_ids = 0
+
+        #: Frames discarded for an invalid length
+        self.invalid_lengths = 0
+
+        #: Bytes discarded while waiting for a :data:`~hachi.const.FRAME_DELIMITER`
+        self.discarded_bytes = 0
+
+        #: Frames interrupted by a :data:`~hachi.const.FRAME_DELIMITER` before they were complete
+        self.truncated_frames = 0
+
+        #: Escaped bytes, in :data:`~hachi.const.API_MODE_ESCAPED` only
+        self.escaped_bytes = 0
+
+        #: Frames discarded for an invalid escape sequence, in :data:`~hachi.const.API_MODE_ESCAPED` only
+        self.invalid_escapes = 0
+
+    def snapshot(self, reset=False):
+        """Copy of the counters
+
+        :param bool reset: reset the counters once copied
+        :return: the counters by name, `frames` being a dict of counters by API ID
+        :rtype: dict
+
+        """
+        snapshot = dict((name, getattr(self, name)) for name in self.COUNTERS)
+        snapshot['frames'] = dict(self.frames)
+        if reset:
+            self.reset()
+        return snapshot
+
+    def to_json(self, **kwargs):
+        """Export the counters in JSON
+
+        API IDs of `frames` are formatted as 2-digit hexadecimal strings
+
+        :param kwargs: other arguments of :func:`json.dumps`
+        :rtype: str
+
+        """
+        snapshot = self.snapshot()
+        snapshot['frames'] = dict(('%02x' % api_id, count) for api_id, count in snapshot['frames'].items())
+        return json.dumps(snapshot, sort_keys=True, **kwargs)
+
+    def to_prometheus(self, prefix='hachi_parser', labels=None):
+        """Export the counters in the Prometheus text format
+
+        Each counter is named after its attribute with the `prefix` and a ``_total`` suffix,
+        `frames` having an ``api_id`` label
+
+        :param str prefix: prefix of the metric names
+        :param dict labels: labels added to all the metrics, such as the port of the parser
+        :rtype: str
+
+        """
+        labels = ['%s="%s"' % (name, _escape_label(value)) for name, value in sorted((labels or {}).items())]
+        lines = []
+        for name in self.COUNTERS + ('frames',):
+            metric = '%s_%s_total' % (prefix, name)
+            lines.append('# HELP %s %s' % (metric, self.DESCRIPTIONS[name]))
+            lines.append('# TYPE %s counter' % metric)
+            if name == 'frames':
+                for api_id, count in sorted(self.frames.items()):
+                    lines.append('%s{%s} %d' % (metric, ','.join(labels + ['api_id="%02x"' % api_id]), count))
+            elif labels:
+                lines.append('%s{%s} %d' % (metric, ','.join(labels), getattr(self, name)))
+            else:
+                lines.append('%s %d' % (metric, getattr(self, name)))
+        return '\n'.join(lines) + '\n'
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, ' '.join('%s=%r' % item for item in sorted(self.snapshot().items())))
+
+
+def _escape_label(value):
+    """Escape a label value in the Prometheus text format"""
+    return ('%s' % value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
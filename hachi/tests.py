@@ -1,17 +1,43 @@
 # -*- coding: utf-8 -*-
-from __future__ import unicode_literals
+from hachi.asyncio import XBeeProtocol as AsyncioXBeeProtocol
 from hachi.const import (TRANSMIT_OPTION_BROADCAST_PACKET, ADDRESS_16_BROADCAST,
     TRANSMIT_OPTION_DISABLE_ACKNOWLEDGEMENT, ADDRESS_16_USE_64_BIT_ADDRESSING,
     BROADCAST_RADIUS_MAX_HOPS, TRANSMIT_OPTION_APPLY_CHANGES, ADDRESS_64_COORDINATOR,
-    FRAME_DELIMITER, ESCAPE, XON, XOFF)
-from hachi.core import escape, escape_frame, unescape, XBee
-from hachi.request import (Tx64Request, Tx16Request, AtRequest, AtQueueRequest,
-    ZBTxRequest, RemoteAtRequest, ZBExplicitTxRequest)
+    FRAME_DELIMITER, ESCAPE, XON, XOFF, API_MODE_UNESCAPED, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_API_IDS)
+from hachi.core import escape, escape_frame, escape_frame_into, unescape, XBee, iter_responses, encode_frames
+from hachi.correlation import Correlator
+from hachi.exceptions import Busy, Closed, Timeout
+from hachi.request import (XBeeRequest, Tx64Request, Tx16Request, AtRequest, AtQueueRequest,
+    ZBTxRequest, RemoteAtRequest, ZBExplicitTxRequest, REQUEST_MAP, RequestTemplate)
 from hachi.response import (RemoteAtResponse, Rx16Response, Rx64Response,
     ZBRxResponse, AtResponse, ModemStatusResponse, TxStatusResponse,
     ZBTxStatusResponse, ZBExplicitRxResponse, ZBIoSampleResponse,
-    Rx16IoSampleResponse, Rx64IoSampleResponse, bitcount)
+    Rx16IoSampleResponse, Rx64IoSampleResponse, FrameView, bitcount, decode_zb_io_samples)
+import asyncio
+import copy
+import io
+import json
+import pickle
+import socket
+import threading
 import unittest
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    from hachi.twisted import XBeeProtocol as TwistedXBeeProtocol
+    from twisted.internet.task import Clock
+    try:
+        from twisted.internet.testing import StringTransport
+    except ImportError:
+        from twisted.test.proto_helpers import StringTransport
+except ImportError:
+    TwistedXBeeProtocol = None
+try:
+    from hachi.serial import XBeeSerial, ResponseQueue
+except ImportError:
+    XBeeSerial = ResponseQueue = None
 
 
 class ResponseTestCase(unittest.TestCase):
@@ -384,9 +410,78 @@ class ResponseTestCase(unittest.TestCase):
         self.assertTrue(response.checksum == 0x3e)
         self.assertTrue(response.verify())
 
+    def test_samples(self):
+        response = Rx16IoSampleResponse(bytearray.fromhex('7E 00 14 83 7D 84 23 01 02 14 88 00 80 00 8F 03 ED 00 08 02 4C 00 0C 58'))
+        self.assertTrue(list(response.samples()) == [0x80, 143, 1005, 0x08, 588, 12])
+        response = Rx64IoSampleResponse(bytearray.fromhex('7E 00 12 82 00 13 A2 00 40 52 2B AA 23 01 01 14 00 03 ED 00 0C 2C'))
+        self.assertTrue(list(response.samples()) == [1005, 12])
+        response = Rx64IoSampleResponse(bytearray.fromhex('7E 00 12 82 00 13 A2 00 40 52 2B AA 23 01 02 14 00 03 ED 00 0C 2B'))
+        with self.assertRaises(ValueError):
+            response.samples()
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_samples_numpy(self):
+        response = Rx64IoSampleResponse(bytearray.fromhex('7E 00 14 82 00 13 A2 00 40 52 2B AA 23 01 02 14 88 00 80 00 8F 03 ED 00 08 02 4C 00 0C 3E'))
+        samples = response.samples(numpy=True)
+        self.assertTrue(samples.shape == (2, 3))
+        self.assertTrue(samples.tolist() == [[0x80, 143, 1005], [0x08, 588, 12]])
+
+    def test_decode_zb_io_samples(self):
+        frames = [bytearray.fromhex('7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 0A 00 14 02 25 02 A6 45'),
+                  ZBIoSampleResponse(bytearray.fromhex('7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 8A 00 14 02 25 02 A6 0A BB 00'))]
+        columns = decode_zb_io_samples(frames)
+        self.assertTrue(list(columns['source_address_64']) == [0x0013a20040522baa] * 2)
+        self.assertTrue(list(columns['source_address_16']) == [0x7d84] * 2)
+        self.assertTrue(list(columns['digital_mask']) == [0x1c] * 2)
+        self.assertTrue(list(columns['analog_mask']) == [0x0a, 0x8a])
+        self.assertTrue(list(columns['digital']) == [0x14] * 2)
+        self.assertTrue(list(columns['analog_0']) == [0xffff] * 2)
+        self.assertTrue(list(columns['analog_1']) == [549] * 2)
+        self.assertTrue(list(columns['analog_3']) == [678] * 2)
+        self.assertTrue(list(columns['analog_7']) == [0xffff, 0x0abb])
+        with self.assertRaises(ValueError):
+            decode_zb_io_samples([bytearray.fromhex('7E 00 02 8A 01 74')])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def test_decode_zb_io_samples_numpy(self):
+        frames = [bytearray.fromhex('7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 0A 00 14 02 25 02 A6 45'),
+                  bytearray.fromhex('7E 00 14 92 00 13 A2 00 40 52 2B AA 7D 84 01 01 00 1C 8A 00 14 02 25 02 A6 0A BB 00')]
+        columns = decode_zb_io_samples(frames, numpy=True)
+        self.assertTrue(columns['analog_1'].tolist() == [549, 549])
+        self.assertTrue(numpy.isnan(columns['analog_7'][0]))
+        self.assertTrue(columns['analog_7'][1] == 0x0abb)
+
+    def test_layout(self):
+        frame = bytearray.fromhex('7E 00 18 91 00 13 A2 00 40 52 2B AA 7D 84 E0 E0 22 11 C1 05 02 52 78 44 61 74 61 52')
+        response = ZBExplicitRxResponse(frame)
+        self.assertTrue(response.cluster_id == 0x2211)
+        self.assertTrue(response.profile_id == 0xc105)
+        self.assertFalse(hasattr(response, '__dict__'))
+        with self.assertRaises(AttributeError):
+            response.frame_id
+        with self.assertRaises(AttributeError):
+            response.cluster_id = 0
+        with self.assertRaises(ValueError):
+            ZBExplicitRxResponse(frame[:12])
+
+    def test_layout_subclass(self):
+        class CustomZBRxResponse(ZBRxResponse):
+            layout = ZBRxResponse.layout + (('header', 'H'),)
+
+            @property
+            def data(self):
+                return self.id_data[13:]
+
+        response = CustomZBRxResponse(bytearray.fromhex('7E 00 12 90 00 13 A2 00 40 52 2B AA 7D 84 01 52 78 44 61 74 61 0D'))
+        self.assertTrue(response.options == 0x01)
+        self.assertTrue(response.header == 0x5278)
+        self.assertTrue(response.data == b'Data')
+
     def test_bitcount(self):
         self.assertTrue(bitcount(0b00100110) == 3)
         self.assertTrue(bitcount(0b10001) == 2)
+        self.assertTrue(bitcount(0x8000000000000001) == 2)
+        self.assertTrue(bitcount(0) == 0)
 
 
 class RequestTestCase(unittest.TestCase):
@@ -471,6 +566,53 @@ class RequestTestCase(unittest.TestCase):
         self.assertTrue(request.length == len(request))
         self.assertTrue(request.checksum == 0xf5)
 
+    def test_write_into(self):
+        requests = [AtRequest(b'SP'), Tx16Request(bytearray([0x88, 0x66]), 0x1234), ZBTxRequest(b'')]
+        buffer = bytearray()
+        offset = 0
+        for request in requests:
+            offset += request.write_into(buffer, offset)
+        self.assertTrue(offset == len(buffer))
+        self.assertTrue(buffer == b''.join(bytes(request.frame) for request in requests))
+        buffer = bytearray(16)
+        self.assertTrue(AtRequest(b'SP').write_into(memoryview(buffer), 8) == 8)
+        self.assertTrue(buffer[8:] == bytearray.fromhex('7E 00 04 08 01 53 50 53'))
+        self.assertTrue(REQUEST_MAP[0x10] is ZBTxRequest)
+
+    def test_id_data_subclass(self):
+        class CustomAtRequest(XBeeRequest):
+            api_id = 0x08
+
+            @property
+            def id_data(self):
+                return bytearray([0x01]) + b'SP'
+
+        request = CustomAtRequest()
+        self.assertTrue(request.frame == bytearray.fromhex('7E 00 04 08 01 53 50 53'))
+        self.assertTrue(len(request) == 4)
+        self.assertTrue(repr(request) == '<CustomAtRequest(len=4)>')
+
+    def test_template(self):
+        request = RemoteAtRequest(b'IS', 0x0013a2004052117e, destination_address_16=0x7d84)
+        template = RequestTemplate(request)
+        self.assertTrue(template.encode() == escape_frame(request.frame))
+        request.frame_id = 0x13
+        request.parameter = bytearray([0x7e, 0x01])
+        self.assertTrue(template.encode(bytearray([0x7e, 0x01]), 0x13) == escape_frame(request.frame))
+        template = RequestTemplate(request, API_MODE_UNESCAPED)
+        buffer = bytearray()
+        self.assertTrue(template.encode_into(buffer, bytearray([0x7e, 0x01])) == len(request.frame))
+        self.assertTrue(buffer == request.frame)
+
+    def test_subclass(self):
+        class TaggedAtRequest(AtRequest):
+            pass
+
+        request = TaggedAtRequest(b'SP')
+        request.tag = 'sleep period'
+        self.assertTrue(request.frame == bytearray.fromhex('7E 00 04 08 01 53 50 53'))
+        self.assertFalse(hasattr(AtRequest(b'SP'), '__dict__'))
+
 
 class XBeeTestCase(unittest.TestCase):
     def setUp(self):
@@ -520,6 +662,105 @@ class XBeeTestCase(unittest.TestCase):
         self.assertTrue(isinstance(self.xbee.response, ZBIoSampleResponse))
         self.assertTrue(len(self.xbee.buffer) == 22)
 
+    def test_feed_immutable_response(self):
+        self.xbee.feed(bytearray.fromhex('7E 00 12 90 00 13 A2 00 40 52 2B AA 7D 5D 84 01 52 78 44 61 74 61 0D 12 34'))
+        self.assertTrue(len(self.responses) == 1)
+        response = self.responses[0]
+        self.assertTrue(response.frame == bytearray.fromhex('7E 00 12 90 00 13 A2 00 40 52 2B AA 7D 84 01 52 78 44 61 74 61 0D'))
+        self.assertTrue(response.data == b'RxData')
+        self.assertTrue(response.data.readonly)
+        self.xbee.buffer[-1] = 0x00
+        self.assertTrue(response.checksum == 0x0d)
+
+    def test_feed_chunks(self):
+        data = bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 12 92 00 7D 33 A2 00 40 A0 96 7D 5E 0F 25 41 01 00 00 01 02 80 CB')
+        for size in range(1, len(data) + 1):
+            xbee = XBee(self.callback)
+            for i in range(0, len(data), size):
+                xbee.feed(bytes(data[i:i + size]))
+            self.assertTrue(isinstance(xbee.response, ZBIoSampleResponse))
+            self.assertTrue(xbee.response.frame == bytearray.fromhex('7E 00 12 92 00 13 A2 00 40 A0 96 7E 0F 25 41 01 00 00 01 02 80 CB'))
+        self.assertTrue(len(self.responses) == 2 * len(data))
+
+    def test_feed_double_escape(self):
+        self.xbee.feed(bytearray.fromhex('7E 00 03 89 7D 7D 5D'))
+        self.assertTrue(len(self.responses) == 0)
+        self.assertTrue(self.xbee.buffer == bytearray.fromhex('7E 00 03 89 7D'))
+
+    def test_feed_unescaped(self):
+        xbee = XBee(self.callback, API_MODE_UNESCAPED)
+        xbee.feed(bytearray.fromhex('7E 00 12 92 00 13 A2 00 40 A0 96 7E 0F 25 41 01 00 00 01 02 80 CB 7E 00 03 89 2A'))
+        self.assertTrue(len(self.responses) == 1)
+        self.assertTrue(isinstance(self.responses[0], ZBIoSampleResponse))
+        self.assertTrue(self.responses[0].source_address_64 == 0x0013a20040a0967e)
+        self.assertTrue(len(xbee.buffer) == 5)
+
+    def test_feed_resync(self):
+        # corrupted length and checksum, the valid frame that follows is recovered
+        xbee = XBee(self.callback, API_MODE_UNESCAPED, max_length=256)
+        xbee.feed(bytearray.fromhex('7E 40 12 92 00 7E 00 02 8A 01 75 7E 00 03 89'))
+        xbee.feed(bytearray.fromhex('2A 74 D8'))
+        xbee.feed(bytearray.fromhex('7E 00 07 90 00 13 A2 00 40 A0 96 7E 00 02 8A 01 74'))
+        self.assertTrue(len(self.responses) == 2)
+        self.assertTrue(isinstance(self.responses[0], TxStatusResponse))
+        self.assertTrue(isinstance(self.responses[1], ModemStatusResponse))
+
+    def test_feed_bounded(self):
+        xbee = XBee(self.callback, API_MODE_UNESCAPED, max_length=16)
+        xbee.feed(bytearray.fromhex('7E 00 14 90') + bytearray(100) + bytearray.fromhex('7E 00 03 89 2A 74 D8'))
+        self.assertTrue(len(self.responses) == 1)
+        self.assertTrue(xbee.buffer.nbytes == 7)
+        xbee.feed(bytearray.fromhex('7E 00 10 90') + bytearray(10))
+        self.assertTrue(xbee.buffer.nbytes == 14)
+
+    def test_feed_grow(self):
+        self.assertTrue(len(self.xbee._frame) == XBee.initial_length + 4)
+        frame = bytearray.fromhex('7E 03 F6 90') + bytearray(1013) + bytearray([0xff - 0x90])
+        self.xbee.feed(frame)
+        self.assertTrue(len(self.responses) == 1 and len(self.responses[0].data) == 1002)
+        self.assertTrue(len(self.xbee._frame) == 1018)
+        xbee = XBee(self.callback, max_length=500)
+        xbee.feed(frame)
+        self.assertTrue(len(self.responses) == 1 and len(xbee._frame) == 260)
+
+    def test_stats(self):
+        self.xbee.feed(bytearray.fromhex('00 01 7E 00 03 89 2A 74 D8 7E 00 02 8A 01 00 7E 00 03 89 2A 74 00'))
+        self.xbee.feed(bytearray.fromhex('7E 00 03 89 7D 31 00 65 7E 00 02 FF 7E 00 00'))
+        stats = self.xbee.stats.snapshot()
+        self.assertTrue(stats['bytes_received'] == 37)
+        self.assertTrue(stats['frames'] == {0x89: 2})
+        self.assertTrue(stats['checksum_errors'] == 2)
+        self.assertTrue(stats['unknown_api_ids'] == 1)
+        self.assertTrue(stats['invalid_lengths'] == 1)
+        self.assertTrue(stats['discarded_bytes'] == 2)
+        self.assertTrue(stats['escaped_bytes'] == 1)
+        self.assertTrue(stats['truncated_frames'] == 0)
+        self.xbee.feed(bytearray.fromhex('7E 00 03 89 7E'))
+        self.assertTrue(self.xbee.stats.snapshot(reset=True)['truncated_frames'] == 1)
+        self.assertTrue(self.xbee.stats.bytes_received == 0)
+        self.assertTrue(self.xbee.stats.frames == {})
+
+    def test_stats_export(self):
+        self.xbee.feed(bytearray.fromhex('00 7E 00 03 89 2A 74 D8'))
+        self.assertTrue(json.loads(self.xbee.stats.to_json())['frames'] == {'89': 1})
+        metrics = self.xbee.stats.to_prometheus(labels={'port': '/dev/ttyUSB0'}).splitlines()
+        self.assertTrue('# TYPE hachi_parser_bytes_received_total counter' in metrics)
+        self.assertTrue('hachi_parser_bytes_received_total{port="/dev/ttyUSB0"} 8' in metrics)
+        self.assertTrue('hachi_parser_discarded_bytes_total{port="/dev/ttyUSB0"} 1' in metrics)
+        self.assertTrue('hachi_parser_frames_total{port="/dev/ttyUSB0",api_id="89"} 1' in metrics)
+        self.assertTrue('hachi_parser_checksum_errors_total 0' in self.xbee.stats.to_prometheus().splitlines())
+
+    def test_feed_invalid_escape(self):
+        self.xbee.feed(bytearray.fromhex('7E 00 03 89 7D 00 74 D8 7E 00 03 89 2A 74 D8'))
+        self.assertTrue(len(self.responses) == 1 and self.responses[0].frame_id == 0x2a)
+        self.assertTrue(self.xbee.stats.invalid_escapes == 1)
+        self.assertTrue(self.xbee.stats.discarded_bytes == 3)
+
+    def test_feed_invalid_length(self):
+        self.xbee.feed(bytearray.fromhex('7E 00 04 89 2A 74 00 D8'))
+        self.assertTrue(len(self.xbee.buffer) == 0)
+        self.assertTrue(len(self.responses) == 0)
+
     def test_feed_multiple_incomplete(self):
         self.xbee.feed(bytearray.fromhex('7E 00 03 89 2A 7E 00 12 92 00 7D 33 A2 00'))
         self.assertTrue(len(self.responses) == 0)
@@ -542,6 +783,62 @@ class XBeeTestCase(unittest.TestCase):
         self.assertTrue(self.xbee.response is None)
         self.assertTrue(len(self.xbee.buffer) == 0)
 
+    def test_feed_lazy(self):
+        xbee = XBee(self.callback, lazy=True)
+        xbee.feed(b'~\x00\x03\x89*t\xd8')
+        view = self.responses[0]
+        self.assertTrue(isinstance(view, FrameView))
+        self.assertTrue(view.api_id == 0x89 and len(view) == 3)
+        self.assertTrue(view.frame == b'~\x00\x03\x89*t\xd8')
+        self.assertTrue(view._response is None)
+        self.assertTrue(view.frame_id == 0x2a)
+        self.assertTrue(isinstance(view.response, TxStatusResponse))
+        with self.assertRaises(AttributeError):
+            view.source_address
+        for copied in (copy.copy(view), pickle.loads(pickle.dumps(view))):
+            self.assertTrue(copied.frame == view.frame and copied.frame_id == 0x2a)
+        self.assertTrue(copy.copy(FrameView.__new__(FrameView)) is not None)
+
+    def test_subscribe(self):
+        xbee = XBee(self.callback)
+        xbee.subscribed_only = True
+        tx_statuses, modem_statuses, at_responses = [], [], []
+        xbee.subscribe(tx_statuses.append, 0x89)
+        xbee.subscribe(modem_statuses.append, 0x8a)
+        xbee.subscribe(at_responses.append, 0x88, frame_id=0x02)
+        xbee.feed(b'~\x00\x03\x89*t\xd8~\x00\x02\x8a\x01t~\x00\x05\x88\x01NI\x00\xdf~\x00\x05\x88\x02NI\x00\xde')
+        self.assertTrue(len(tx_statuses) == len(modem_statuses) == len(at_responses) == 1)
+        self.assertTrue(at_responses[0].frame_id == 0x02)
+        self.assertTrue(len(self.responses) == 1 and self.responses[0].frame_id == 0x01)
+        xbee.unsubscribe(modem_statuses.append, 0x8a)
+        xbee.feed(b'~\x00\x02\x8a\x01t')
+        self.assertTrue(xbee.response is None)
+        self.assertTrue(len(modem_statuses) == 1 and len(self.responses) == 1)
+        self.assertTrue(xbee.stats.skipped_frames == 1 and xbee.stats.frames[0x8a] == 1)
+        with self.assertRaises(ValueError):
+            xbee.unsubscribe(modem_statuses.append, 0x8a)
+
+    def test_iter_responses(self):
+        data = bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 12 92 00 7D 33 A2 00 40 A0 96 7D 5E 0F 25 41 01 00 00 01 02 80 CB') * 3
+        for source in (io.BytesIO(data), [bytes(data[i:i + 5]) for i in range(0, len(data), 5)]):
+            responses = list(iter_responses(source, chunk_size=4))
+            self.assertTrue(len(responses) == 6)
+            self.assertTrue(all(isinstance(r, TxStatusResponse) for r in responses[::2]))
+            self.assertTrue(all(isinstance(r, ZBIoSampleResponse) for r in responses[1::2]))
+
+    def test_iter_responses_socket(self):
+        device, host = socket.socketpair()
+        try:
+            responses = iter_responses(host)
+            device.sendall(bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 02 8A'))
+            self.assertTrue(isinstance(next(responses), TxStatusResponse))
+            device.sendall(bytearray.fromhex('06 6F'))
+            device.close()
+            self.assertTrue(isinstance(next(responses), ModemStatusResponse))
+            self.assertTrue(next(responses, None) is None)
+        finally:
+            host.close()
+
     def test_escape(self):
         for special_byte in (FRAME_DELIMITER, ESCAPE, XON, XOFF):
             self.assertTrue(0x20 ^ escape(special_byte) == special_byte)
@@ -553,6 +850,23 @@ class XBeeTestCase(unittest.TestCase):
         escaped_frame = escape_frame(frame)
         self.assertTrue(escaped_frame == bytearray.fromhex('7E 00 03 89 2A 74 D8 7D 5E 00 12 92 00 7D 5D 33 A2 00 40 A0 96 7D 5D 5E 0F 25 41 01 00 00 01 02 80 CB'))
 
+    def test_escape_frame_unchanged(self):
+        frame = bytearray.fromhex('7E 00 03 89 2A 74 D8')
+        self.assertTrue(escape_frame(frame) is frame)
+        self.assertTrue(escape_frame(bytes(frame)) == frame)
+
+    def test_escape_frame_into(self):
+        buffer = bytearray.fromhex('7E 00 03 89 2A 74 D8')
+        frame = bytearray.fromhex('7E 00 05 08 11 4E 49 7E D1')
+        self.assertTrue(escape_frame_into(memoryview(frame), buffer) == 11)
+        self.assertTrue(buffer == bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 05 08 7D 31 4E 49 7D 5E D1'))
+
+    def test_encode_frames(self):
+        requests = [AtRequest(b'NI', bytearray([0x7e]), 0x11), Tx16Request(bytearray([0x88, 0x66]), 0x1234)]
+        self.assertTrue(encode_frames(requests) == bytearray.fromhex('7E 00 05 08 7D 31 4E 49 7D 5E D1 7E 00 07 01 01 12 34 00 88 66 C9'))
+        self.assertTrue(encode_frames(requests, API_MODE_UNESCAPED) == bytearray.fromhex('7E 00 05 08 11 4E 49 7E D1 7E 00 07 01 01 12 34 00 88 66 C9'))
+        self.assertTrue(encode_frames([]) == bytearray())
+
     def test_escape_frame_bad_frame(self):
         frame = bytearray.fromhex('00 03 89 2A')
         with self.assertRaises(ValueError):
@@ -565,11 +879,350 @@ class XBeeTestCase(unittest.TestCase):
             unescape(0x01)
 
 
+@unittest.skipIf(XBeeSerial is None, 'pySerial is not installed')
+class XBeeSerialTestCase(unittest.TestCase):
+    def setUp(self):
+        self.xbee = XBeeSerial('loop://')
+
+    def tearDown(self):
+        self.xbee.close()
+
+    def test_send(self):
+        self.xbee.send(AtRequest(b'NI', bytearray([0x7e]), 0x11))
+        self.xbee.serial.timeout = 0
+        self.assertTrue(self.xbee.serial.read(16) == bytearray.fromhex('7E 00 05 08 7D 31 4E 49 7D 5E D1'))
+
+    def test_send_many(self):
+        self.xbee.send_many([AtRequest(b'NI', bytearray([0x7e]), 0x11), AtRequest(b'SP')])
+        self.xbee.serial.timeout = 0
+        self.assertTrue(self.xbee.serial.read(32) == bytearray.fromhex('7E 00 05 08 7D 31 4E 49 7D 5E D1 7E 00 04 08 01 53 50 53'))
+
+    def test_read_response(self):
+        self.xbee.serial.write(bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 02 8A 01 74 7E 00 02'))
+        self.assertTrue(isinstance(self.xbee.read_response(0), TxStatusResponse))
+        self.assertTrue(isinstance(self.xbee.read_response(0), ModemStatusResponse))
+        with self.assertRaises(Timeout):
+            self.xbee.read_response(0)
+        self.xbee.serial.write(bytearray.fromhex('8A 00 75'))
+        self.assertTrue(self.xbee.read_response(0).status == 0x00)
+
+    def test_read_responses(self):
+        self.xbee.serial.write(bytearray.fromhex('7E 00 03 89 2A 74 D8 7E 00 02 8A 01 74 7E 00 02 8A 00 75'))
+        self.assertTrue(len(self.xbee.read_responses(2, 0)) == 2)
+        self.xbee.serial.write(bytearray.fromhex('7E 00 02 8A 01 74'))
+        responses = self.xbee.read_responses(timeout=0)
+        self.assertTrue([response.status for response in responses] == [0x00, 0x01])
+        self.assertTrue(self.xbee.read_responses(timeout=0) == [])
+
+    def test_reader(self):
+        self.xbee.serial.write(bytearray.fromhex('7E 00 03 89 2A 74 D8'))
+        self.assertTrue(isinstance(self.xbee.read_response(0), TxStatusResponse))
+        self.xbee.serial.write(bytearray.fromhex('7E 00 02 8A 01 74 7E 00 02'))
+        responses = self.xbee.start_reader()
+        self.xbee.serial.write(bytearray.fromhex('8A 00 75'))
+        self.assertTrue(responses.get(1).status == 0x01)
+        self.assertTrue(self.xbee.read_response(1).status == 0x00)
+        with self.assertRaises(Timeout):
+            responses.get(0)
+        self.xbee.stop_reader()
+        self.assertTrue(list(responses) == [])
+        with self.assertRaises(Closed):
+            responses.get()
+
+    def test_reader_close_full(self):
+        self.xbee.start_reader(maxsize=1)
+        self.xbee.serial.write(bytearray.fromhex('7E 00 02 8A 01 74') * 3)
+        thread = threading.Thread(target=self.xbee.close)
+        thread.start()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(len(self.xbee.responses) >= 1)
+
+    def test_reader_error(self):
+        called = threading.Event()
+
+        def handler(response):
+            called.set()
+            raise RuntimeError('Handler failed')
+        self.xbee.subscribe(handler, 0x89)
+        responses = self.xbee.start_reader()
+        self.xbee.serial.write(bytearray.fromhex('7E 00 03 89 2A 74 D8'))
+        self.assertTrue(called.wait(1))
+        self.xbee.serial.write(bytearray.fromhex('7E 00 02 8A 01 74'))
+        self.assertTrue(isinstance(responses.get(1), ModemStatusResponse))
+        self.assertTrue(self.xbee._reader.is_alive())
+        self.assertFalse(responses.closed)
+
+    def test_reader_expire(self):
+        self.xbee.correlator = Correlator(timeout=0.01)
+        self.xbee.start_reader()
+        future = self.xbee.correlator.register(AtRequest(b'NI'))
+        self.assertTrue(isinstance(future.exception(1), Timeout))
+        self.assertTrue(len(self.xbee.correlator) == 0)
+
+    def test_writer(self):
+        self.xbee.start_writer()
+        handles = []
+        threads = [threading.Thread(target=lambda: handles.extend(self.xbee.send(AtRequest(b'SP')) for _ in range(50)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for handle in handles:
+            handle.wait(1)
+        self.xbee.stop_writer()
+        self.assertTrue(all(handle.done for handle in handles))
+        self.xbee.serial.timeout = 0
+        self.assertTrue(self.xbee.serial.read(2000) == bytearray.fromhex('7E 00 04 08 01 53 50 53') * 200)
+        self.assertTrue(self.xbee.send(AtRequest(b'SP')) is None)
+
+    def test_writer_stopping(self):
+        self.xbee.start_writer()
+        handles = []
+        with self.xbee._write_lock:  # block the writer thread on its first write
+            self.xbee.send(AtRequest(b'SP'))
+            with self.xbee._pending_condition:
+                self.xbee._writer_stop = True
+                self.xbee._pending_condition.notify()
+            thread = threading.Thread(target=lambda: handles.append(self.xbee.send(AtRequest(b'NI'))))
+            thread.start()
+        thread.join()
+        self.assertTrue(handles[0].done)
+        handles[0].wait(0)
+        self.xbee.stop_writer()
+        self.xbee.serial.timeout = 0
+        self.assertTrue(self.xbee.serial.read(16) == bytearray.fromhex('7E 00 04 08 01 53 50 53 7E 00 04 08 01 4E 49 5F'))
+
+    def test_send_unescaped(self):
+        self.xbee.api_mode = API_MODE_UNESCAPED
+        self.xbee.send(AtRequest(b'NI', bytearray([0x7e]), 0x11))
+        self.xbee.serial.timeout = 0
+        self.assertTrue(self.xbee.serial.read(16) == bytearray.fromhex('7E 00 05 08 11 4E 49 7E D1'))
+
+
+@unittest.skipIf(ResponseQueue is None, 'pySerial is not installed')
+class ResponseQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tx_status = TxStatusResponse(bytearray.fromhex('7E 00 03 89 2A 74 D8'))
+        self.modem_status = ModemStatusResponse(bytearray.fromhex('7E 00 02 8A 01 74'))
+
+    def test_drop_oldest(self):
+        queue = ResponseQueue(2, OVERFLOW_DROP_OLDEST)
+        for response in (self.tx_status, self.modem_status, self.modem_status):
+            queue.put(response)
+        self.assertTrue(queue.dropped == 1)
+        self.assertTrue(queue.get_many(timeout=0) == [self.modem_status, self.modem_status])
+
+    def test_drop_api_ids(self):
+        queue = ResponseQueue(2, OVERFLOW_DROP_API_IDS, [0x8a])
+        for response in (self.modem_status, self.tx_status, self.tx_status, self.modem_status):
+            queue.put(response)
+        self.assertTrue(queue.dropped == 2)
+        self.assertTrue(queue.get_many(timeout=0) == [self.tx_status, self.tx_status])
+
+    def test_close(self):
+        queue = ResponseQueue()
+        queue.put(self.tx_status)
+        queue.close()
+        self.assertTrue(list(queue) == [self.tx_status])
+        self.assertTrue(queue.get_many() == [])
+
+
+class CorrelatorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.correlator = Correlator(timeout=5, clock=lambda: self.now)
+
+    def test_resolve(self):
+        request = AtRequest(b'NI', frame_id=0)
+        future = self.correlator.register(request)
+        self.assertTrue(request.frame_id == 0x01)
+        self.assertTrue(len(self.correlator) == 1)
+        self.assertTrue(0x01 in self.correlator and 0x02 not in self.correlator)
+        self.assertFalse(self.correlator.resolve(ModemStatusResponse(bytearray.fromhex('7E 00 02 8A 01 74'))))
+        response = AtResponse(bytearray.fromhex('7E 00 05 88 01 4E 49 00 DF'))
+        self.assertTrue(self.correlator.resolve(response))
+        self.assertTrue(future.result(0) is response)
+        self.assertFalse(self.correlator.resolve(response))
+        self.assertTrue(len(self.correlator) == 0)
+        self.assertTrue(self.correlator.expire(10) == 0)
+
+    def test_expire(self):
+        future = self.correlator.register(AtRequest(b'NI'))
+        self.correlator.register(AtRequest(b'NI'), timeout=10)
+        self.assertTrue(self.correlator.next_deadline == 5)
+        self.now = 5
+        self.assertTrue(self.correlator.expire() == 1)
+        with self.assertRaises(Timeout):
+            future.result(0)
+        self.assertTrue(len(self.correlator) == 1)
+
+    def test_prune_deadlines(self):
+        pending = self.correlator.register(AtRequest(b'NI'))
+        for _ in range(1000):
+            request = AtRequest(b'NI')
+            future = self.correlator.register(request, timeout=1)
+            self.assertTrue(self.correlator.release(request.frame_id, future))
+        self.assertTrue(len(self.correlator._deadlines) <= 2)
+        self.assertTrue(self.correlator.next_deadline == 5)
+        self.now = 5
+        self.assertTrue(self.correlator.expire() == 1)
+        self.assertTrue(pending.done() and self.correlator.next_deadline is None)
+
+    def test_xbee(self):
+        responses = []
+        xbee = XBee(responses.append, correlator=self.correlator)
+        xbee.subscribed_only = True
+        future = self.correlator.register(AtRequest(b'NI'))
+        xbee.feed(bytearray.fromhex('7E 00 05 88 01 4E 49 00 DF 7E 00 05 88 01 4E 49 00 DF 7E 00 02 8A 01 74'))
+        self.assertTrue(future.result(0).frame_id == 0x01)
+        self.assertTrue(responses == [])
+        self.assertTrue(xbee.stats.skipped_frames == 2)
+        xbee.subscribed_only = False
+        xbee.feed(bytearray.fromhex('7E 00 05 88 01 4E 49 00 DF'))
+        self.assertTrue(len(responses) == 1 and responses[0].frame_id == 0x01)
+
+    def test_busy(self):
+        requests = [AtRequest(b'NI') for _ in range(255)]
+        for request in requests:
+            self.correlator.register(request)
+        self.assertTrue(sorted(request.frame_id for request in requests) == list(range(1, 256)))
+        with self.assertRaises(Busy):
+            self.correlator.register(AtRequest(b'NI'))
+
+
+class AsyncioXBeeProtocolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.device, sock = socket.socketpair()
+        self.device.settimeout(1)
+        _, self.protocol = self.loop.run_until_complete(self.loop.create_connection(lambda: AsyncioXBeeProtocol(timeout=1), sock=sock))
+
+    def tearDown(self):
+        self.protocol.transport.close()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        self.device.close()
+
+    def test_send_and_wait(self):
+        tasks = [self.loop.create_task(self.protocol.send_and_wait(AtRequest(b'NI', frame_id=0))) for _ in range(2)]
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.assertTrue(self.device.recv(16) == bytearray.fromhex('7E 00 04 08 01 4E 49 5F 7E 00 04 08 02 4E 49 5E'))
+        self.device.sendall(bytearray.fromhex('7E 00 02 8A 01 74 7E 00 05 88 02 4E 49 00 DE 7E 00 05 88 01 4E 49 00 DF'))
+        responses = self.loop.run_until_complete(asyncio.gather(*tasks))
+        self.assertTrue([response.frame_id for response in responses] == [0x01, 0x02])
+        self.assertTrue(isinstance(self.loop.run_until_complete(self.protocol.__anext__()), ModemStatusResponse))
+        self.assertTrue(len(self.protocol.correlator) == 0)
+
+    def test_send_and_wait_timeout(self):
+        with self.assertRaises(Timeout):
+            self.loop.run_until_complete(self.protocol.send_and_wait(AtRequest(b'NI'), 0.01))
+        self.assertTrue(len(self.protocol.correlator) == 0)
+
+    def test_connection_lost(self):
+        task = self.loop.create_task(self.protocol.send_and_wait(AtRequest(b'NI')))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.device.close()
+        with self.assertRaises(Closed):
+            self.loop.run_until_complete(task)
+        with self.assertRaises(StopAsyncIteration):
+            self.loop.run_until_complete(self.protocol.__anext__())
+        with self.assertRaises(Closed):
+            self.loop.run_until_complete(asyncio.wait_for(self.protocol.send_and_wait(AtRequest(b'NI'), None), 1))
+
+
+@unittest.skipIf(TwistedXBeeProtocol is None, 'Twisted is not installed')
+class TwistedXBeeProtocolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.responses = []
+        self.protocol = TwistedXBeeProtocol(timeout=1, clock=self.clock)
+        self.protocol.responseReceived = self.responses.append
+        self.transport = StringTransport()
+        self.protocol.makeConnection(self.transport)
+
+    def test_send_request(self):
+        results = []
+        self.protocol.sendRequest(AtRequest(b'NI', frame_id=0)).addCallback(results.append)
+        self.assertTrue(self.transport.value() == bytearray.fromhex('7E 00 04 08 01 4E 49 5F'))
+        self.protocol.dataReceived(bytearray.fromhex('7E 00 02 8A 01 74 7E 00 05 88 01 4E 49 00 DF'))
+        self.assertTrue(len(results) == 1 and results[0].frame_id == 0x01)
+        self.assertTrue(len(self.responses) == 1 and isinstance(self.responses[0], ModemStatusResponse))
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_send_request_timeout(self):
+        failures = []
+        self.protocol.sendRequest(AtRequest(b'NI')).addErrback(failures.append)
+        self.clock.advance(1)
+        self.assertTrue(len(failures) == 1 and failures[0].check(Timeout))
+        self.assertTrue(len(self.protocol.correlator) == 0)
+
+    def test_send_request_busy(self):
+        for _ in range(256):
+            self.protocol.sendRequest(AtRequest(b'NI'))
+        self.assertTrue(len(self.protocol.correlator) == 255)
+        self.protocol.dataReceived(bytearray.fromhex('7E 00 05 88 01 4E 49 00 DF'))
+        self.assertTrue(self.transport.value().endswith(bytearray.fromhex('7E 00 04 08 01 4E 49 5F')))
+        self.assertTrue(len(self.protocol.correlator) == 255)
+
+    def test_subscribed_only(self):
+        results, modem_statuses = [], []
+        self.protocol.subscribed_only = True
+        self.protocol.subscribe(modem_statuses.append, 0x8a)
+        self.protocol.sendRequest(AtRequest(b'NI', frame_id=0)).addCallback(results.append)
+        self.protocol.dataReceived(bytearray.fromhex('7E 00 02 8A 01 74 7E 00 05 88 01 4E 49 00 DF 7E 00 05 88 01 4E 49 00 DF'))
+        self.assertTrue(len(results) == 1 and len(modem_statuses) == 1)
+        self.assertTrue(self.responses == [])
+        self.assertTrue(self.protocol.stats.skipped_frames == 1)
+
+    def test_producer(self):
+        self.assertTrue(self.transport.producer is self.protocol)
+        self.protocol.pauseProducing()
+        self.protocol.send(AtRequest(b'NI'))
+        self.assertTrue(self.transport.value() == b'')
+        self.protocol.resumeProducing()
+        self.assertTrue(self.transport.value() == bytearray.fromhex('7E 00 04 08 01 4E 49 5F'))
+
+    def test_producer_send_request(self):
+        failures = []
+        self.protocol.maxPending = 2
+        self.protocol.pauseProducing()
+        self.protocol.sendRequest(AtRequest(b'NI', frame_id=0))
+        self.protocol.send(AtRequest(b'SP'))
+        self.protocol.sendRequest(AtRequest(b'NI')).addErrback(failures.append)
+        self.assertTrue(len(failures) == 1 and failures[0].check(Busy))
+        with self.assertRaises(Busy):
+            self.protocol.send(AtRequest(b'SP'))
+        self.assertTrue(self.transport.value() == b'')
+        self.assertTrue(len(self.protocol.correlator) == 0)
+        self.assertFalse(self.clock.getDelayedCalls())
+        self.protocol.resumeProducing()
+        self.assertTrue(self.transport.value() == bytearray.fromhex('7E 00 04 08 01 53 50 53 7E 00 04 08 01 4E 49 5F'))
+        self.assertTrue(len(self.protocol.correlator) == 1)
+        self.assertTrue(len(self.clock.getDelayedCalls()) == 1)
+
+    def test_connection_lost(self):
+        failures = []
+        self.protocol.sendRequest(AtRequest(b'NI')).addErrback(failures.append)
+        self.protocol.connectionLost(None)
+        self.assertTrue(len(failures) == 1 and failures[0].check(Closed))
+        self.protocol.sendRequest(AtRequest(b'NI')).addErrback(failures.append)
+        self.assertTrue(len(failures) == 2 and failures[1].check(Closed))
+        with self.assertRaises(Closed):
+            self.protocol.send(AtRequest(b'NI'))
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ResponseTestCase))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(RequestTestCase))
     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(XBeeTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(CorrelatorTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(AsyncioXBeeProtocolTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TwistedXBeeProtocolTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(XBeeSerialTestCase))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(ResponseQueueTestCase))
     return suite
 
 if __name__ == '__main__':
@@ -1,16 +1,76 @@
 # -*- coding: utf-8 -*-
-from __future__ import absolute_import, unicode_literals
-from .core import XBee
+from .const import API_MODE_ESCAPED
+from .core import XBee, escape_frame
+from .correlation import Correlator
+from .exceptions import Busy, Closed, Timeout
+from collections import deque
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.interfaces import IPushProducer
 from twisted.internet.protocol import Protocol
+from zope.interface import implementer
 
 
 __all__ = ['XBeeProtocol']
 
 
+@implementer(IPushProducer)
 class XBeeProtocol(XBee, Protocol):
-    """:class:`~hachi.core.XBee` parser twisted implementation"""
-    def __init__(self):
-        super(XBeeProtocol, self).__init__(self.responseReceived)
+    """:class:`~hachi.core.XBee` parser twisted implementation
+
+    Requests sent with :meth:`sendRequest` are correlated with their response by frame id,
+    up to 255 at once, other requests waiting for a free frame id. Other responses are
+    passed to :meth:`responseReceived`.
+
+    The protocol registers itself as streaming producer of its transport: when the write
+    buffer of the transport fills, the transport pauses the protocol. While :attr:`paused`,
+    requests sent with :meth:`sendRequest` wait to be written, their timeout starting only
+    once they are, and frames sent with :meth:`send` are kept until it resumes. At most
+    :attr:`maxPending` frames and requests wait at once, others being refused with
+    :class:`~hachi.exceptions.Busy` so callers slow down.
+
+    :param int api_mode: API mode of the module, :data:`~hachi.const.API_MODE_ESCAPED`
+        or :data:`~hachi.const.API_MODE_UNESCAPED`
+    :param timeout: default timeout of :meth:`sendRequest` in seconds, `None` for no timeout
+    :type timeout: None or int or float
+    :param clock: provider of :class:`~twisted.internet.interfaces.IReactorTime` for the
+        timeouts, the reactor if `None`
+    :param max_length: maximum length of the frames, see :class:`~hachi.core.XBee`
+    :type max_length: None or int
+
+    """
+    #: Maximum number of frames and requests waiting to be written
+    maxPending = 1024
+
+    def __init__(self, api_mode=API_MODE_ESCAPED, timeout=None, clock=None, max_length=None):
+        super(XBeeProtocol, self).__init__(self._responseReceived, api_mode, max_length=max_length,
+                                          correlator=_DeferredCorrelator())
+
+        #: Default timeout of :meth:`sendRequest` in seconds
+        self.timeout = timeout
+
+        if clock is None:
+            from twisted.internet import reactor as clock
+        #: Provider of :class:`~twisted.internet.interfaces.IReactorTime` for the timeouts
+        self.clock = clock
+
+        #: Whether the transport paused the protocol
+        self.paused = False
+
+        #: Whether the connection is lost
+        self.closed = False
+
+        self._frames = deque()
+        self._requests = deque()
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+
+    def connectionLost(self, reason):
+        self.closed = True
+        self._frames.clear()
+        self.correlator.fail(Closed())
+        while self._requests:
+            self._requests.popleft()[2].errback(Closed())
 
     def dataReceived(self, data):
         self.feed(data)
@@ -18,6 +78,9 @@ class XBeeProtocol(XBee, Protocol):
     def responseReceived(self, response):
         """Callback called whenever a :class:`~hachi.response.XBeeResponse` is received
 
+        Responses correlated with a request sent with :meth:`sendRequest` and those handled by
+        a subscribed handler are not passed to it
+
         Subclasses must implement this
 
         :param response: the received response
@@ -25,3 +88,114 @@ class XBeeProtocol(XBee, Protocol):
 
         """
         raise NotImplementedError
+
+    def _responseReceived(self, response):
+        """Pass a response to :meth:`responseReceived`, which may be replaced"""
+        self.responseReceived(response)
+
+    def send(self, request):
+        """Send a :class:`~hachi.request.XBeeRequest`
+
+        The frame is kept until the transport resumes the protocol if it is :attr:`paused`
+
+        :param request: the request to send
+        :type request: :class:`~hachi.request.XBeeRequest`
+        :raise: :class:`~hachi.exceptions.Busy` when :attr:`maxPending` frames and requests
+            are already waiting
+        :raise: :class:`~hachi.exceptions.Closed` when the connection is lost
+
+        """
+        if self.closed:
+            raise Closed
+        frame = bytes(escape_frame(request.frame) if self.api_mode == API_MODE_ESCAPED else request.frame)
+        if self.paused:
+            if len(self._frames) + len(self._requests) >= self.maxPending:
+                raise Busy
+            self._frames.append(frame)
+        else:
+            self.transport.write(frame)
+
+    def sendRequest(self, request, timeout=None):
+        """Send a :class:`~hachi.request.XBeeRequest` and wait for its response
+
+        The `frame_id` of the request is set to a free frame id once it is written, that is
+        when the protocol is not :attr:`paused` and a frame id is free, and the timeout starts
+        then. The returned :class:`~twisted.internet.defer.Deferred` fails with
+        :class:`~hachi.exceptions.Timeout` when timeout is exceeded,
+        :class:`~hachi.exceptions.Closed` when the connection is lost and
+        :class:`~hachi.exceptions.Busy` right away when :attr:`maxPending` frames and requests
+        are already waiting
+
+        :param request: the request to send
+        :type request: :class:`~hachi.request.XBeeRequest`
+        :param timeout: timeout in seconds, :attr:`timeout` if `None`
+        :type timeout: None or int or float
+        :return: the response
+        :rtype: :class:`~twisted.internet.defer.Deferred`
+
+        """
+        if self.closed:
+            return fail(Closed())
+        if len(self._frames) + len(self._requests) >= self.maxPending:
+            return fail(Busy())
+        if timeout is None:
+            timeout = self.timeout
+        deferred = Deferred()
+        self._requests.append((request, timeout, deferred))
+        self._sendRequests()
+        return deferred
+
+    def _sendRequests(self):
+        """Send the requests waiting to be written"""
+        while self._requests and not self.paused and not self.closed and len(self.correlator) < 255:
+            request, timeout, deferred = self._requests.popleft()
+            future = self.correlator.register(request)
+            if timeout is not None:
+                call = self.clock.callLater(timeout, self._expire, request.frame_id, future)
+                future.addBoth(self._cancelExpire, call)
+            future.addBoth(self._requestDone)
+            future.chainDeferred(deferred)
+            self.send(request)
+
+    def _expire(self, frame_id, future):
+        """Fail a request when its timeout is exceeded"""
+        if self.correlator.release(frame_id, future):
+            self.correlator.set_exception(future, Timeout())
+
+    def _requestDone(self, result):
+        """Send the requests waiting for a frame id once a request is done"""
+        self._sendRequests()
+        return result
+
+    def _cancelExpire(self, result, call):
+        """Cancel the timeout of a request once it is resolved"""
+        if call.active():
+            call.cancel()
+        return result
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        while self._frames and not self.paused:
+            self.transport.write(self._frames.popleft())
+        self._sendRequests()
+
+    def stopProducing(self):
+        self.paused = True
+        self._frames.clear()
+
+
+class _DeferredCorrelator(Correlator):
+    """:class:`~hachi.correlation.Correlator` with twisted deferreds"""
+    def create_future(self):
+        return Deferred()
+
+    def set_result(self, future, response):
+        if not future.called:
+            future.callback(response)
+
+    def set_exception(self, future, exception):
+        if not future.called:
+            future.errback(exception)
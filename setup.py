@@ -13,13 +13,18 @@ setup(name='hachi',
     author='Antoine Bertin',
     author_email='diaoulael@gmail.com',
     packages=find_packages(),
+    python_requires='>=3.8',
     classifiers=['Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
+        'Programming Language :: Python :: 3.12',
         'Topic :: Software Development :: Libraries :: Python Modules'],
     test_suite='hachi.tests.suite',
-    extras_require={'Twisted': ['Twisted'], 'Serial': ['pyserial']})
+    extras_require={'Twisted': ['Twisted'], 'Serial': ['pyserial'], 'NumPy': ['numpy']})